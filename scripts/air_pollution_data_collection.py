@@ -1,8 +1,8 @@
 import os
 import sys
 import json
+import argparse
 import logging
-from json import load
 from utils import get_project_root
 
 project_root = get_project_root()
@@ -10,40 +10,58 @@ sys.path.insert(0, project_root)
 
 from src.domains.air_pollution.sensor_loader import collect_all_stations_data
 from src.domains.air_pollution.fetch_weather_data import add_weather_columns
+from src.domains.air_pollution.station_grid import GRID_RESOLUTION
 from src.domains.air_pollution.filter_stations import filter_stations_by_history
-from src.preprocess.feature_selector import select_features
+from src.pipeline.runner import PipelineRunner
+from src.preprocess.feature_selector import apply_feature_selection, choose_features
 from src.preprocess.scaler import scale_features
 from src.preprocess.time_features import add_time_features
+from src.storage.frame_store import export_csv, frame_path, write_frame
 
 logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
 
+def select_stage(df, threshold, max_correlation=None):
+    selected_features = choose_features(df, "air_pollution", threshold=threshold, max_correlation=max_correlation, keep=["PM2.5"])
+    return apply_feature_selection(df, "air_pollution", selected_features), selected_features
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the processed air pollution dataset.")
+    parser.add_argument("--min_days", type=int, default=730, help="Minimum days of history a station needs")
+    parser.add_argument("--threshold", type=float, default=0.9, help="Minimum fill ratio for a feature to be kept")
+    parser.add_argument("--max_correlation", type=float, default=None,
+                        help="Drop features whose absolute correlation with an already kept feature exceeds this")
+    parser.add_argument("--scale_fit_end", type=str, default=None,
+                        help="Fit the scaler only on rows up to this date, e.g. the end of the training period")
+    parser.add_argument("--grid_resolution", type=float, default=None,
+                        help=f"Snap stations to a grid of this many degrees and fetch weather once per cell, "
+                             f"e.g. {GRID_RESOLUTION} for the ERA5-Land grid; by default each station's exact coordinates are used")
+    parser.add_argument("--no_cache", action="store_true", help="Run every stage instead of reusing cached stage outputs")
+    parser.add_argument("--export_csv", action="store_true", help="Also write air_pollution_dataset.csv next to the Parquet dataset")
+    args = parser.parse_args()
+
     project_root = get_project_root()
 
     raw_dir = os.path.join(project_root, "data", "air_pollution", "raw")
     processed_dir = os.path.join(project_root, "data", "air_pollution", "processed")
     os.makedirs(processed_dir, exist_ok=True)
 
-    df = collect_all_stations_data(raw_dir)
-
-    df = add_weather_columns(df)
-    df = filter_stations_by_history(df, min_days=730)
-    df = select_features(df, processed_dir, "air_pollution", threshold=0.9)
-    df = add_time_features(df)
-
-    selected_features_path = os.path.join(processed_dir, "selected_features.json")
-    with open(selected_features_path, "r") as f:
-        selected_features = load(f)
-
-    df_scaled, scaler = scale_features(df, selected_features, target="PM2.5")
+    runner = PipelineRunner(os.path.join(processed_dir, "stage_cache"), sources=[raw_dir], use_cache=not args.no_cache)
 
-    scaler_serializable = {
-        k: {ik: float(iv) for ik, iv in v.items()}
-        for k, v in scaler.items()
-    }
+    df = runner.run("collect", collect_all_stations_data, raw_dir)
+    df = runner.run("weather", add_weather_columns, df, grid_resolution=args.grid_resolution)
+    df = runner.run("filter", filter_stations_by_history, df, min_days=args.min_days)
+    df, selected_features = runner.run("select", select_stage, df, threshold=args.threshold, max_correlation=args.max_correlation)
+    df = runner.run("time_features", add_time_features, df)
+    df_scaled, scaler = runner.run("scale", scale_features, df, selected_features, target="PM2.5", fit_end=args.scale_fit_end)
 
-    df_scaled.to_csv(os.path.join(processed_dir, "air_pollution_dataset.csv"), index=False)
+    dataset_path = frame_path(processed_dir, "air_pollution_dataset")
+    write_frame(df_scaled, dataset_path)
+    if args.export_csv:
+        logging.info(f"Exported CSV to {export_csv(dataset_path)}")
+    with open(os.path.join(processed_dir, "selected_features.json"), "w") as f:
+        json.dump(selected_features, f, indent=2)
     with open(os.path.join(processed_dir, "scaler_params.json"), "w") as f:
-        json.dump(scaler_serializable, f, indent=2)
+        json.dump(scaler, f, indent=2)
 
+    runner.summary()
     logging.info("Pipeline complete: processed data saved.")
@@ -1,5 +1,6 @@
 import os
 import sys
+import argparse
 import logging
 from datetime import datetime
 from utils import get_project_root
@@ -7,16 +8,24 @@ from utils import get_project_root
 project_root = get_project_root()
 sys.path.insert(0, project_root)
 
-from src.domains.traffic.fetch_glasgow_traffic import fetch_glasgow_traffic
+from src.domains.traffic.fetch_glasgow_traffic import fetch_glasgow_traffic, stream_glasgow_traffic
 
 logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Download Glasgow traffic history.")
+    parser.add_argument("--stream", action="store_true", help="Write per-week partitions as pages arrive and resume from the last checkpoint")
+    parser.add_argument("--csv", action="store_true", help="Save a one-shot download as CSV instead of Parquet")
+    args = parser.parse_args()
+
     start_date = datetime(2023, 6, 1)
     end_date = datetime(2023, 7, 1)
 
-    timestamp_id = int(datetime.utcnow().timestamp() * 1000)
-    filename = f"{timestamp_id}_glasgow_traffic_data.csv"
-    output_path = os.path.join("data", "traffic", "raw", filename)
+    if args.stream:
+        stream_glasgow_traffic(start_date, end_date, os.path.join("data", "traffic", "raw"))
+    else:
+        timestamp_id = int(datetime.utcnow().timestamp() * 1000)
+        filename = f"{timestamp_id}_glasgow_traffic_data.{'csv' if args.csv else 'parquet'}"
+        output_path = os.path.join("data", "traffic", "raw", filename)
 
-    fetch_glasgow_traffic(start_date, end_date, output_path)
+        fetch_glasgow_traffic(start_date, end_date, output_path)
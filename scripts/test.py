@@ -1,21 +1,30 @@
 import os
-import json
-import numpy as np
+import sys
 from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
 from keras.models import load_model
 
 # === Параметры ===
 dataset_type = "traffic"
 model_name = "default"
-project_root = os.path.dirname(os.path.dirname(__file__))
+target_column = "flow"
+sequence_length = 30
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from src.training.dataset_cache import prepared_dataset_dir
+from src.training.dataset_store import open_prepared_dataset
+from src.preprocess.scaler import FeatureScaler
 
 # === Пути ===
 model_path = os.path.join(project_root, "outputs", "models", dataset_type, f"{dataset_type}_{model_name}_lstm.keras")
-data_dir = os.path.join(project_root, "data", dataset_type, "processed", "prepared_dataset")
+dataset_dir = os.path.join(project_root, "data", dataset_type, "processed")
+data_dir = prepared_dataset_dir(dataset_dir, dataset_type, target_column, sequence_length)
+scaler_path = os.path.join(dataset_dir, "scaler_params.json")
 
 # === Загрузка данных ===
-X_test = np.load(os.path.join(data_dir, "X_test.npy"))
-y_test = np.load(os.path.join(data_dir, "y_test.npy"))
+arrays, _ = open_prepared_dataset(data_dir)
+X_test = arrays["X_test"]
+y_test = arrays["y_test"]
 
 # === Загрузка модели ===
 model = load_model(model_path)
@@ -28,7 +37,12 @@ mae = mean_absolute_error(y_test, y_pred)
 mse = mean_squared_error(y_test, y_pred)
 r2 = r2_score(y_test, y_pred)
 
+# === Метрики в исходных единицах ===
+scaler = FeatureScaler.load(scaler_path)
+mae_original = mean_absolute_error(scaler.inverse_transform(y_test, target_column), scaler.inverse_transform(y_pred, target_column))
+
 print(f"📊 Evaluation results for model: {dataset_type}_{model_name}_lstm.keras")
 print(f"MAE: {mae:.4f}")
 print(f"MSE: {mse:.4f}")
 print(f"R² : {r2:.4f}")
+print(f"MAE ({target_column}): {mae_original:.4f}")
@@ -1,39 +1,79 @@
 import os
 import sys
-import json
+import argparse
 import logging
 from json import load
+import pandas as pd
 from utils import get_project_root
 
 project_root = get_project_root()
 sys.path.insert(0, project_root)
 
 from src.domains.traffic.merge_csv_files import merge_traffic_csv_files
+from src.domains.traffic.chunked_merge import merge_traffic_files_chunked
 from src.domains.traffic.filter_data import filter_and_sort_traffic_data
 from src.domains.traffic.fill_missing_data import fill_missing_traffic_data
-from src.preprocess.feature_selector import select_features
+from src.domains.traffic.incremental import (
+    find_new_raw_files,
+    has_running_totals,
+    load_raw_manifest,
+    save_raw_manifest,
+    site_aggregates_from_totals,
+    update_running_totals,
+)
+from src.preprocess.feature_selector import apply_feature_selection, select_features
 from src.preprocess.time_features import add_time_features
-from src.preprocess.scaler import scale_features
+from src.preprocess.scaler import FeatureScaler
+from src.storage.frame_store import (
+    append_frame, export_csv, find_frame, frame_path, is_parquet, list_parts, read_frame, remove_frame, write_frame
+)
 
 logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
 
-def main():
-    input_dir = os.path.join(project_root, "data", "traffic", "raw")
-    output_dir = os.path.join(project_root, "data", "traffic", "processed")
-    os.makedirs(output_dir, exist_ok=True)
+# The merge budget bounds only merging, filtering and deduplication of the raw files; the cleaned
+# dataset is then loaded whole, and filling, selection and scaling run in memory
+def merge_raw_files(input_dir, files, merged_path, merge_memory_budget=None):
+    if merge_memory_budget:
+        logging.info("Merging, filtering and deduplicating raw traffic files out of core...")
+        merge_traffic_files_chunked(input_dir, files, merged_path, merge_memory_budget)
+        return read_frame(merged_path)
 
     logging.info("Merging raw Glasgow traffic CSV files...")
-    merged_df = merge_traffic_csv_files(input_dir)
+    merged_df = merge_traffic_csv_files(input_dir, files)
 
     logging.info("Filtering and sorting merged traffic data...")
-    cleaned_df = filter_and_sort_traffic_data(merged_df)
-    cleaned_df.to_csv(os.path.join(output_dir, "cleaned_traffic_dataset.csv"), index=False)
+    return filter_and_sort_traffic_data(merged_df)
+
+# The last day of every run goes into a part of its own. Its imputed slots were chosen from only the
+# records seen so far, so the next incremental run drops that part and processes the day again
+def write_processed(df, dataset_path, append=False):
+    if not append:
+        remove_frame(dataset_path)
+    last_day = df["date"].dt.normalize() == df["date"].max().normalize()
+    for rows in (df[~last_day], df[last_day]):
+        if not rows.empty:
+            append_frame(rows, dataset_path)
+
+def last_day_part(dataset_path, last_day):
+    if dataset_path is None or not is_parquet(dataset_path):
+        return None
+    part = list_parts(dataset_path)[-1]
+    dates = pd.to_datetime(read_frame(part, columns=["date"])["date"]).dt.normalize()
+    return part if (dates == last_day).all() else None
+
+def run_full(input_dir, output_dir, merge_memory_budget=None, scale_fit_end=None, max_correlation=None):
+    raw_files = find_new_raw_files(input_dir, None)
+    cleaned_path = frame_path(output_dir, "cleaned_traffic_dataset")
+    cleaned_df = merge_raw_files(input_dir, raw_files, cleaned_path, merge_memory_budget)
+    if not merge_memory_budget:
+        write_frame(cleaned_df, cleaned_path)
 
     logging.info("Filling missing records...")
     filled_df = fill_missing_traffic_data(cleaned_df)
 
     logging.info("Selecting features...")
-    selected_df = select_features(filled_df, output_dir, dataset_type="traffic", threshold=0.9)
+    selected_df = select_features(filled_df, output_dir, dataset_type="traffic", threshold=0.9,
+                                  max_correlation=max_correlation, keep=["flow"])
 
     logging.info("Adding time features...")
     enriched_df = add_time_features(selected_df)
@@ -43,19 +83,103 @@ def main():
     with open(selected_features_path, "r") as f:
         selected_features = load(f)
 
-    df_scaled, scaler = scale_features(enriched_df, selected_features, target=None)
+    scaler = FeatureScaler(selected_features).fit(enriched_df, fit_end=scale_fit_end)
+    df_scaled = scaler.transform(enriched_df, inplace=True)
 
-    scaler_serializable = {
-        k: {ik: float(iv) for ik, iv in v.items()}
-        for k, v in scaler.items()
-    }
+    write_processed(df_scaled, frame_path(output_dir, "traffic_dataset"))
+    scaler.save(os.path.join(output_dir, "scaler_params.json"))
 
-    df_scaled.to_csv(os.path.join(output_dir, "traffic_dataset.csv"), index=False)
-    with open(os.path.join(output_dir, "scaler_params.json"), "w") as f:
-        json.dump(scaler_serializable, f, indent=2)
+    update_running_totals(output_dir, cleaned_df, reset=True)
+    save_raw_manifest(output_dir, input_dir, raw_files, pd.to_datetime(cleaned_df["date"]).max())
 
     logging.info("Pipeline complete: processed data saved.")
     logging.info(f"Final row count: {len(df_scaled)}")
 
+def run_incremental(input_dir, output_dir, merge_memory_budget=None, scale_fit_end=None, max_correlation=None):
+    manifest = load_raw_manifest(output_dir)
+    state_files = ["selected_features.json", "scaler_params.json"]
+    dataset_path = find_frame(output_dir, "traffic_dataset")
+    last_date = pd.Timestamp(manifest["last_date"]) if manifest is not None else None
+    last_day = last_date.normalize() if last_date is not None else None
+    if manifest is None or not has_running_totals(output_dir) or not all(
+        os.path.exists(os.path.join(output_dir, f)) for f in state_files
+    ) or last_day_part(dataset_path, last_day) is None:
+        logging.info("No incremental state found, running the full pipeline...")
+        run_full(input_dir, output_dir, merge_memory_budget, scale_fit_end, max_correlation)
+        return
+
+    new_files = find_new_raw_files(input_dir, manifest)
+    if not new_files:
+        logging.info("No new raw traffic files to process.")
+        return
+
+    logging.info(f"Merging {len(new_files)} new raw traffic files...")
+    batch_path = frame_path(output_dir, "new_traffic_batch")
+    try:
+        cleaned_df = merge_raw_files(input_dir, new_files, batch_path, merge_memory_budget)
+    finally:
+        remove_frame(batch_path)
+    cleaned_df["date"] = pd.to_datetime(cleaned_df["date"])
+
+    cleaned_df = cleaned_df[cleaned_df["date"] > last_date]
+    if cleaned_df.empty:
+        logging.info(f"New files contain no records after {last_date}.")
+        save_raw_manifest(output_dir, input_dir, new_files, last_date, manifest)
+        return
+
+    cleaned_path = find_frame(output_dir, "cleaned_traffic_dataset") or frame_path(output_dir, "cleaned_traffic_dataset")
+    # Records of the last processed day, which is imputed again now that the rest of it may have arrived
+    day_df = read_frame(cleaned_path, start=last_day, end=last_date) if os.path.exists(cleaned_path) else cleaned_df.iloc[:0]
+    append_frame(cleaned_df, cleaned_path)
+
+    logging.info("Filling missing records from running site aggregates...")
+    value_totals, coord_counts = update_running_totals(output_dir, cleaned_df)
+    site_aggregates = site_aggregates_from_totals(value_totals, coord_counts)
+    filled_df = fill_missing_traffic_data(
+        pd.concat([day_df, cleaned_df], ignore_index=True), site_aggregates=site_aggregates, sites=site_aggregates.index
+    )
+
+    with open(os.path.join(output_dir, "selected_features.json"), "r") as f:
+        selected_features = load(f)
+    scaler = FeatureScaler.load(os.path.join(output_dir, "scaler_params.json"))
+
+    selected_df = apply_feature_selection(filled_df, "traffic", selected_features)
+    enriched_df = add_time_features(selected_df)
+    df_scaled = scaler.transform(enriched_df, inplace=True)
+
+    remove_frame(last_day_part(dataset_path, last_day))
+    write_processed(df_scaled, dataset_path, append=True)
+    save_raw_manifest(output_dir, input_dir, new_files, cleaned_df["date"].max(), manifest)
+
+    logging.info(f"Incremental update complete: appended {len(df_scaled)} rows "
+                 f"from {cleaned_df['date'].min()} to {cleaned_df['date'].max()}.")
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the processed Glasgow traffic dataset.")
+    parser.add_argument("--incremental", action="store_true", help="Only process raw files that arrived since the last run")
+    parser.add_argument("--merge_memory_budget_mb", type=float, default=None,
+                        help="Merge, filter and deduplicate raw files out of core within this many MB; "
+                             "filling, feature selection and scaling still load the cleaned dataset into memory")
+    parser.add_argument("--scale_fit_end", type=str, default=None,
+                        help="Fit the scaler only on rows up to this date, e.g. the end of the training period")
+    parser.add_argument("--max_correlation", type=float, default=None,
+                        help="Drop features whose absolute correlation with an already kept feature exceeds this")
+    parser.add_argument("--export_csv", action="store_true", help="Also write traffic_dataset.csv next to the Parquet dataset")
+    args = parser.parse_args()
+
+    input_dir = os.path.join(project_root, "data", "traffic", "raw")
+    output_dir = os.path.join(project_root, "data", "traffic", "processed")
+    os.makedirs(output_dir, exist_ok=True)
+
+    merge_memory_budget = int(args.merge_memory_budget_mb * 1024 ** 2) if args.merge_memory_budget_mb else None
+    if args.incremental:
+        run_incremental(input_dir, output_dir, merge_memory_budget, args.scale_fit_end, args.max_correlation)
+    else:
+        run_full(input_dir, output_dir, merge_memory_budget, args.scale_fit_end, args.max_correlation)
+
+    dataset_path = find_frame(output_dir, "traffic_dataset")
+    if args.export_csv and dataset_path is not None and is_parquet(dataset_path):
+        logging.info(f"Exported CSV to {export_csv(dataset_path)}")
+
 if __name__ == "__main__":
     main()
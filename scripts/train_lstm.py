@@ -4,13 +4,18 @@ import json
 import time
 import argparse
 import logging
-from sklearn.metrics import r2_score
+import numpy as np
+from sklearn.metrics import mean_absolute_error, r2_score
 from utils import get_project_root
 
 project_root = get_project_root()
 sys.path.insert(0, project_root)
 
 from src.training.lstm_trainer import train_lstm
+from src.preprocess.scaler import FeatureScaler
+from src.training.dataset_cache import directory_size, prepared_dataset_dir
+from src.training.dataset_store import load_manifest
+from src.training.input_pipeline import steady_throughput
 from src.visualization.loss_plotter import plot_loss
 from src.visualization.real_vs_predicted_plotter import plot_real_vs_predicted
 
@@ -31,6 +36,14 @@ def main():
     parser.add_argument("--dropout", type=float, default=0.3, help="Dropout rate after LSTM")
     parser.add_argument("--dense_units", type=int, default=32, help="Number of units in Dense layer")
     parser.add_argument("--model_name", type=str, default="lstm_default", help="Model tag or variant name")
+    parser.add_argument("--sequence_length", type=int, default=30, help="Number of time steps per input window")
+    parser.add_argument("--max_cache_gb", type=float, default=20.0, help="Size limit of the prepared dataset cache in GB")
+    parser.add_argument("--lazy_windows", action="store_true", help="Generate windows on demand from a window index instead of materialized X arrays")
+    parser.add_argument("--tf_data", action="store_true", help="Feed training through a tf.data pipeline with parallel batch loading and prefetch")
+    parser.add_argument("--shuffle_buffer", type=int, default=None, help="tf.data shuffle buffer size (default: the whole training split, or 32768 windows with --cache_dataset)")
+    parser.add_argument("--cache_dataset", type=str, default=None, help="Cache loaded windows in tf.data: 'memory' or a cache file prefix")
+    parser.add_argument("--jit_compile", action="store_true", help="Compile the train step with XLA")
+    parser.add_argument("--prepare_workers", type=int, default=1, help="Processes that prepare windows from site shards of a Parquet dataset (0 = all cores)")
 
     args = parser.parse_args()
 
@@ -64,7 +77,15 @@ def main():
         units=args.units,
         dropout=args.dropout,
         dense_units=args.dense_units,
-        target_column=target_col
+        target_column=target_col,
+        sequence_length=args.sequence_length,
+        lazy_windows=args.lazy_windows,
+        max_cache_bytes=int(args.max_cache_gb * 1024 ** 3),
+        prepare_workers=args.prepare_workers,
+        input_pipeline=args.tf_data,
+        shuffle_buffer=args.shuffle_buffer,
+        cache_dataset=args.cache_dataset,
+        jit_compile=args.jit_compile
     )
     end_time = time.time()
     training_time = end_time - start_time
@@ -77,8 +98,16 @@ def main():
         output_dir=os.path.join(project_root, diagram_subdir)
     )
 
+    prepared_dir = prepared_dataset_dir(
+        dataset_dir,
+        args.dataset_type,
+        target_col,
+        args.sequence_length,
+        layout="index" if args.lazy_windows else "windows"
+    )
+
     plot_real_vs_predicted(
-        dataset_dir=dataset_dir,
+        prepared_dir=prepared_dir,
         model_path=model_path,
         scaler_path=scaler_path,
         model_name=args.model_name,
@@ -87,22 +116,39 @@ def main():
         output_dir=os.path.join(project_root, diagram_subdir)
     )
 
-    test_loss, test_mae = model.evaluate(data["X_test"], data["y_test"], verbose=1)
-    y_pred = model.predict(data["X_test"]).flatten()
+    if args.tf_data or args.lazy_windows:
+        test_loss, test_mae = model.evaluate(data["test"], verbose=1)
+        y_pred = model.predict(data["test"]).flatten()
+    else:
+        test_loss, test_mae = model.evaluate(data["X_test"], data["y_test"], verbose=1)
+        y_pred = model.predict(data["X_test"]).flatten()
     r2 = r2_score(data["y_test"], y_pred)
+    scaler = FeatureScaler.load(scaler_path)
+    mae_original = mean_absolute_error(
+        scaler.inverse_transform(data["y_test"], target_col),
+        scaler.inverse_transform(y_pred, target_col)
+    )
 
     logging.info(f"Test MSE: {test_loss:.4f}, Test MAE: {test_mae:.4f}, R²: {r2:.4f}")
     logging.info(f"Training time: {training_time:.2f} seconds | Epoch time: {epoch_time:.2f} seconds")
+    logging.info(f"Training throughput: {steady_throughput(history.history['samples_per_second']):.1f} samples/s")
 
     metrics = {
         "mse": float(test_loss),
         "mae": float(test_mae),
         "r2": float(r2),
+        "mae_original_units": float(mae_original),
+        "train_samples_per_second": round(steady_throughput(history.history["samples_per_second"]), 1),
+        "input_pipeline": "tf.data" if args.tf_data else ("window_sequence" if args.lazy_windows else "numpy"),
+        "input_dtype": np.dtype(load_manifest(prepared_dir)["arrays"]["features" if args.lazy_windows else "X_train"]["dtype"]).name,
+        "prepared_dataset_mb": round(directory_size(prepared_dir) / 1024 ** 2, 1),
+        "jit_compile": args.jit_compile,
         "training_time_seconds": round(training_time, 2),
         "epoch_time_seconds": round(epoch_time, 2),
         "units": args.units,
         "dropout": args.dropout,
         "dense_units": args.dense_units,
+        "sequence_length": args.sequence_length,
         "epochs": args.epochs,
         "batch_size": args.batch_size
     }
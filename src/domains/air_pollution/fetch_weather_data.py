@@ -1,115 +1,220 @@
-import time
 import logging
+import numpy as np
 import pandas as pd
 import openmeteo_requests
-import requests_cache
+from typing import List, Optional, Tuple
+from functools import lru_cache
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from retry_requests import retry
 
-cache = requests_cache.CachedSession(".cache", expire_after=-1)
-session = retry(cache, retries=5, backoff_factor=0.2)
+from src.domains.rate_limiter import TokenBucket
+from src.domains.air_pollution.weather_store import WeatherStore
+from src.domains.air_pollution.station_grid import build_station_grid, unique_cells
+from src.preprocess.feature_selector import enforce_schema
+
+ARCHIVE_URL = "https://archive-api.open-meteo.com/v1/archive"
+HOURLY_VARIABLES = [
+    "temperature_2m",
+    "relative_humidity_2m",
+    "wind_speed_10m",
+    "surface_pressure"
+]
+WEATHER_COLUMNS = ["temperature", "humidity", "wind_speed", "pressure"]
+BATCH_SIZE = 10
+MAX_WORKERS = 4
+REQUESTS_PER_SECOND = 0.2
+RETRY_LIMIT = 4
+BACKOFF_SECONDS = 15
+
+session = retry(retries=5, backoff_factor=0.2)
 openmeteo = openmeteo_requests.Client(session=session)
 
 logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
 
 
-def fetch_hourly_weather(lat: float, lon: float, start: str, end: str) -> pd.DataFrame:
-    url = "https://archive-api.open-meteo.com/v1/archive"
+@lru_cache(maxsize=None)
+def default_weather_store() -> WeatherStore:
+    # Created on first use rather than at import, so importing this module writes nothing
+    return WeatherStore(columns=WEATHER_COLUMNS)
+
+
+def hourly_frame(response, lat: float, lon: float) -> pd.DataFrame:
+    hourly = response.Hourly()
+    utc_offset = response.UtcOffsetSeconds()
+
+    # Shift to the requested timezone so stored days line up with requested dates
+    df = pd.DataFrame({
+        "datetime": pd.date_range(
+            start=pd.to_datetime(hourly.Time() + utc_offset, unit="s", utc=True),
+            end=pd.to_datetime(hourly.TimeEnd() + utc_offset, unit="s", utc=True),
+            freq=pd.Timedelta(seconds=hourly.Interval()),
+            inclusive="left"
+        ),
+        **{col: hourly.Variables(i).ValuesAsNumpy() for i, col in enumerate(WEATHER_COLUMNS)}
+    })
+
+    df["datetime"] = df["datetime"].dt.tz_localize(None)
+
+    df["latitude"] = lat
+    df["longitude"] = lon
+
+    return df
+
+
+def fetch_hourly_weather_batch(coords: List[Tuple[float, float]], start: str, end: str, url: str = ARCHIVE_URL) -> List[pd.DataFrame]:
     params = {
-        "latitude": lat,
-        "longitude": lon,
+        "latitude": [lat for lat, _ in coords],
+        "longitude": [lon for _, lon in coords],
         "start_date": start,
         "end_date": end,
-        "hourly": [
-            "temperature_2m",
-            "relative_humidity_2m",
-            "wind_speed_10m",
-            "surface_pressure"
-        ],
+        "hourly": HOURLY_VARIABLES,
         "timezone": "Asia/Almaty"
     }
 
-    try:
-        response = openmeteo.weather_api(url, params=params)[0]
-        hourly = response.Hourly()
-
-        df = pd.DataFrame({
-            "datetime": pd.date_range(
-                start=pd.to_datetime(hourly.Time(), unit="s", utc=True),
-                end=pd.to_datetime(hourly.TimeEnd(), unit="s", utc=True),
-                freq=pd.Timedelta(seconds=hourly.Interval()),
-                inclusive="left"
-            ),
-            "temperature": hourly.Variables(0).ValuesAsNumpy(),
-            "humidity": hourly.Variables(1).ValuesAsNumpy(),
-            "wind_speed": hourly.Variables(2).ValuesAsNumpy(),
-            "pressure": hourly.Variables(3).ValuesAsNumpy()
-        })
-
-        df["datetime"] = df["datetime"].dt.tz_localize(None)
-        df["date"] = df["datetime"].dt.date
-        df.drop(columns=["datetime"], inplace=True)
-
-        df["latitude"] = lat
-        df["longitude"] = lon
+    responses = openmeteo.weather_api(url, params=params)
+    return [hourly_frame(response, lat, lon) for response, (lat, lon) in zip(responses, coords)]
 
-        return df
 
+def fetch_hourly_weather(lat: float, lon: float, start: str, end: str) -> pd.DataFrame:
+    try:
+        return fetch_hourly_weather_batch([(lat, lon)], start, end)[0]
     except Exception as e:
         logging.warning(f"Weather API failed for lat={lat}, lon={lon}: {e}")
         return pd.DataFrame()
 
 
-def fetch_daily_weather(lat: float, lon: float, start: str, end: str) -> pd.DataFrame:
-    hourly_df = fetch_hourly_weather(lat, lon, start, end)
-    if hourly_df.empty:
-        return pd.DataFrame()
-
-    grouped = hourly_df.groupby("date").agg({
-        "temperature": "mean",
-        "humidity": "mean",
-        "wind_speed": "mean",
-        "pressure": "mean"
-    }).reset_index()
-
-    grouped["latitude"] = lat
-    grouped["longitude"] = lon
-    return grouped
-
+def aggregate_weather(hourly_df: pd.DataFrame, keys: List[str], frequency: str = "D") -> pd.DataFrame:
+    periods = hourly_df["datetime"].dt.floor(frequency).rename("date")
+    grouped = hourly_df.groupby([*(hourly_df[key] for key in keys), periods], sort=False)[WEATHER_COLUMNS].mean()
+    return grouped.reset_index()
 
-def add_weather_columns(df: pd.DataFrame, sleep_seconds: int = 15) -> pd.DataFrame:
-    start_date = df["date"].min().strftime("%Y-%m-%d")
-    end_date = df["date"].max().strftime("%Y-%m-%d")
 
-    stations = df[["station_name", "latitude", "longitude"]].drop_duplicates()
-    all_weather = []
+def fetch_daily_weather(lat: float, lon: float, start: str, end: str, weather_store: Optional[WeatherStore] = None) -> pd.DataFrame:
+    weather_store = weather_store or default_weather_store()
 
-    station_counter = 1
-    total_stations = len(stations)
+    for gap_start, gap_end in weather_store.missing_ranges(lat, lon, start, end):
+        hourly_df = fetch_hourly_weather(lat, lon, gap_start, gap_end)
+        if not hourly_df.empty:
+            weather_store.append(lat, lon, hourly_df)
 
-    for _, row in stations.iterrows():
-        logging.info(f"Fetching weather for {row['station_name']} ({station_counter}/{total_stations})")
-        station_counter += 1
+    hourly_df = weather_store.read(lat, lon, start, end)
+    if hourly_df.empty:
+        return pd.DataFrame()
 
-        weather = fetch_daily_weather(row["latitude"], row["longitude"], start_date, end_date)
-        if not weather.empty:
-            weather["station_name"] = row["station_name"]
-            all_weather.append(weather)
-        time.sleep(sleep_seconds)
+    hourly_df["latitude"] = lat
+    hourly_df["longitude"] = lon
+    return aggregate_weather(hourly_df, ["latitude", "longitude"])
+
+
+def fetch_weather_batch_with_retry(
+    coords: List[Tuple[float, float]],
+    start: str,
+    end: str,
+    limiter: TokenBucket,
+    url: str = ARCHIVE_URL
+) -> List[pd.DataFrame]:
+    for attempt in range(1, RETRY_LIMIT + 1):
+        limiter.acquire()
+        try:
+            frames = fetch_hourly_weather_batch(coords, start, end, url)
+            limiter.succeed()
+            return frames
+        except Exception as e:
+            backoff = BACKOFF_SECONDS * 2 ** (attempt - 1)
+            logging.warning(f"Weather API failed for {len(coords)} locations (attempt {attempt}), "
+                            f"backing off {backoff}s: {e}")
+            limiter.throttle(backoff)
+
+    logging.warning(f"Giving up on weather for {len(coords)} locations after {RETRY_LIMIT} attempts")
+    return []
+
+
+def fetch_weather_cells(
+    coords: List[Tuple[float, float]],
+    start: str,
+    end: str,
+    batch_size: int = BATCH_SIZE,
+    max_workers: int = MAX_WORKERS,
+    requests_per_second: float = REQUESTS_PER_SECOND,
+    url: str = ARCHIVE_URL,
+    weather_store: Optional[WeatherStore] = None
+):
+    weather_store = weather_store or default_weather_store()
+
+    # Locations missing the same date range share multi-location requests
+    gaps = defaultdict(list)
+    for coord in coords:
+        for gap in weather_store.missing_ranges(*coord, start, end):
+            gaps[gap].append(coord)
+
+    tasks = [
+        (gap, gap_coords[i:i + batch_size])
+        for gap, gap_coords in gaps.items()
+        for i in range(0, len(gap_coords), batch_size)
+    ]
+    logging.info(f"{len(coords)} locations need {len(tasks)} weather requests for {len(gaps)} missing date ranges")
+
+    limiter = TokenBucket(requests_per_second, burst=1)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(fetch_weather_batch_with_retry, batch, gap_start, gap_end, limiter, url): batch
+            for (gap_start, gap_end), batch in tasks
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            for (lat, lon), hourly_df in zip(futures[future], future.result()):
+                weather_store.append(lat, lon, hourly_df)
+            logging.info(f"Fetched weather batch {done}/{len(tasks)}")
+
+
+def load_hourly_weather(coords: List[Tuple[float, float]], start: str, end: str, weather_store: Optional[WeatherStore] = None) -> pd.DataFrame:
+    weather_store = weather_store or default_weather_store()
+
+    frames = []
+    for cell_id, (lat, lon) in enumerate(coords):
+        hourly_df = weather_store.read(lat, lon, start, end)
+        hourly_df["cell_id"] = np.int32(cell_id)
+        frames.append(hourly_df)
+
+    return pd.concat(frames, ignore_index=True)
+
+
+def add_weather_columns(
+    df: pd.DataFrame,
+    batch_size: int = BATCH_SIZE,
+    max_workers: int = MAX_WORKERS,
+    requests_per_second: float = REQUESTS_PER_SECOND,
+    archive_url: str = ARCHIVE_URL,
+    grid_resolution: Optional[float] = None,
+    frequency: str = "D",
+    weather_dir: Optional[str] = None
+) -> pd.DataFrame:
+    weather_store = WeatherStore(weather_dir, columns=WEATHER_COLUMNS) if weather_dir else default_weather_store()
+
+    dates = pd.to_datetime(df["date"])
+    start_date = dates.min().strftime("%Y-%m-%d")
+    end_date = dates.max().strftime("%Y-%m-%d")
+
+    grid = build_station_grid(df, grid_resolution)
+    cells = unique_cells(grid)
+    logging.info(f"Fetching weather for {len(grid)} stations in {len(cells)} grid cells, batches of {batch_size}")
+
+    fetch_weather_cells(cells, start_date, end_date, batch_size, max_workers, requests_per_second, archive_url, weather_store)
+    hourly_df = load_hourly_weather(cells, start_date, end_date, weather_store)
 
-    if not all_weather:
+    if hourly_df.empty:
         logging.warning("No weather data fetched.")
         return df
 
-    weather_df = pd.concat(all_weather, ignore_index=True)
-    df["date"] = pd.to_datetime(df["date"]).dt.date
-    weather_df["date"] = pd.to_datetime(weather_df["date"]).dt.date
-
-    enriched = pd.merge(
-        df,
-        weather_df,
-        on=["date", "station_name", "latitude", "longitude"],
-        how="left"
-    )
-    enriched["date"] = pd.to_datetime(enriched["date"])
-    enriched.dropna(subset=["temperature", "humidity", "wind_speed", "pressure"], inplace=True)
-    return enriched
+    # One aggregation over every cell at once, keyed on (cell_id, datetime64 period)
+    weather_df = aggregate_weather(hourly_df, ["cell_id"], frequency)
+
+    cell_ids = pd.DataFrame({"cell_lat": [lat for lat, _ in cells], "cell_lon": [lon for _, lon in cells]})
+    cell_ids["cell_id"] = np.arange(len(cells), dtype=np.int32)
+    grid = grid.merge(cell_ids, on=["cell_lat", "cell_lon"]).drop(columns=["cell_lat", "cell_lon"])
+
+    enriched = df.assign(date=dates.dt.floor(frequency))
+    enriched = enriched.merge(grid, on=["station_name", "latitude", "longitude"], how="left")
+    enriched = enriched.merge(weather_df, on=["cell_id", "date"], how="left").drop(columns="cell_id")
+    enriched.dropna(subset=WEATHER_COLUMNS, inplace=True)
+    return enforce_schema(enriched, "air_pollution")
@@ -1,27 +1,58 @@
 import os
+import time
 import logging
 import pandas as pd
 from typing import Optional
+from concurrent.futures import ProcessPoolExecutor
 from data.air_pollution.stations import stations
+from src.preprocess.feature_selector import enforce_schema
+
+SENSOR_COLUMNS = {"date": "str", "median": "float64"}
 
 logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
 
+def read_sensor_csv(file_path: str) -> pd.DataFrame:
+    read_kwargs = {"usecols": lambda col: col in SENSOR_COLUMNS, "on_bad_lines": "skip"}
+    try:
+        return pd.read_csv(file_path, dtype=SENSOR_COLUMNS, **read_kwargs)
+    except ValueError:
+        # Non-numeric medians: read as text and coerce instead of dropping the file
+        df = pd.read_csv(file_path, dtype=str, **read_kwargs)
+        if "median" in df.columns:
+            df["median"] = pd.to_numeric(df["median"], errors="coerce")
+        return df
+
 def load_single_parameter(file_path: str, param_name: str) -> Optional[pd.DataFrame]:
+    start = time.perf_counter()
     try:
-        df = pd.read_csv(file_path, on_bad_lines="skip")
+        df = read_sensor_csv(file_path)
     except Exception as e:
         logging.warning(f"Error while reading file {file_path}: {e}")
         return None
 
     if "date" in df.columns and "median" in df.columns:
-        df = df[["date", "median"]].copy()
-        df.rename(columns={"median": param_name}, inplace=True)
+        df = df[["date", "median"]]
+        df = df.rename(columns={"median": param_name})
+        logging.info(f"Read {len(df)} rows from {file_path} in {(time.perf_counter() - start) * 1000:.1f} ms")
         return df
     else:
         logging.info(f"File '{file_path}' skipped: missing necessary columns")
         return None
 
 
+def parameter_series(df: pd.DataFrame, param_name: str) -> pd.Series:
+    dates = pd.to_datetime(df["date"])
+    if dates.dt.tz is not None:
+        dates = dates.dt.tz_localize(None)
+
+    series = pd.Series(df[param_name].to_numpy(), index=pd.DatetimeIndex(dates), name=param_name)
+    series = series[series.index.notna()].sort_index(kind="stable")
+
+    # One value per day; the earliest reading wins, as with the old date-object dedup
+    series.index = series.index.normalize()
+    return series[~series.index.duplicated(keep="first")]
+
+
 def load_station_data(folder_path: str, station_name: str, lat: float, lon: float) -> pd.DataFrame:
     parameter_frames = {}
 
@@ -44,42 +75,49 @@ def load_station_data(folder_path: str, station_name: str, lat: float, lon: floa
         logging.warning(f"No valid parameters found for station {station_name}")
         return pd.DataFrame()
 
-    merged_df = None
-    for param_name, param_df in parameter_frames.items():
-        merged_df = param_df if merged_df is None else pd.merge(merged_df, param_df, on="date", how="outer")
+    merged_df = pd.concat(
+        [parameter_series(param_df, param_name) for param_name, param_df in parameter_frames.items()],
+        axis=1
+    ).sort_index()
 
+    merged_df.index.name = "date"
+    merged_df = merged_df.reset_index()
     merged_df["station_name"] = station_name
     merged_df["latitude"] = lat
     merged_df["longitude"] = lon
-    merged_df["date"] = pd.to_datetime(merged_df["date"]).dt.date
-    merged_df = merged_df.drop_duplicates(subset=["date", "station_name"])
-    merged_df = merged_df.sort_values("date")
 
     return merged_df
 
 
-def collect_all_stations_data(base_folder: str) -> pd.DataFrame:
+def load_station(station: dict, base_folder: str) -> pd.DataFrame:
+    start = time.perf_counter()
+    df = load_station_data(
+        folder_path=os.path.join(base_folder, station["folder"]),
+        station_name=station["name"],
+        lat=station["lat"],
+        lon=station["lon"]
+    )
+    logging.info(f"Loaded station {station['name']} in {time.perf_counter() - start:.2f} s")
+    return df
+
+
+def collect_all_stations_data(base_folder: str, max_workers: Optional[int] = None) -> pd.DataFrame:
     all_data = []
 
-    for station in stations:
-        folder_path = os.path.join(base_folder, station["folder"])
-        df = load_station_data(
-            folder_path=folder_path,
-            station_name=station["name"],
-            lat=station["lat"],
-            lon=station["lon"]
-        )
-        if not df.empty:
-            logging.info(f"Collected data for station: {station['name']}")
-            all_data.append(df)
-        else:
-            logging.warning(f"No data collected for station: {station['name']}")
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        frames = executor.map(load_station, stations, [base_folder] * len(stations))
+
+        for station, df in zip(stations, frames):
+            if not df.empty:
+                logging.info(f"Collected data for station: {station['name']}")
+                all_data.append(df)
+            else:
+                logging.warning(f"No data collected for station: {station['name']}")
 
     if all_data:
-        combined = pd.concat(all_data, ignore_index=True)
+        combined = enforce_schema(pd.concat(all_data, ignore_index=True), "air_pollution")
         logging.info(f"Collected data from {len(all_data)} stations")
         return combined
     else:
         logging.warning("No data collected from any station")
         return pd.DataFrame()
-
@@ -0,0 +1,27 @@
+import numpy as np
+import pandas as pd
+from typing import Optional
+
+# Open-Meteo's archive blends ERA5-Land (0.1°) and ERA5 (0.25°), so stations closer than a tenth of a
+# degree mostly resolve to the same weather series; snapping to it is opt-in, as it changes the
+# coordinates each station's weather is fetched for
+GRID_RESOLUTION = 0.1
+
+
+def snap_to_grid(values: np.ndarray, resolution: Optional[float] = None) -> np.ndarray:
+    values = np.asarray(values, dtype=np.float64)
+    if not resolution:
+        return values
+    return np.round(np.round(values / resolution) * resolution, 6)
+
+
+def build_station_grid(stations: pd.DataFrame, resolution: Optional[float] = None) -> pd.DataFrame:
+    grid = stations[["station_name", "latitude", "longitude"]].drop_duplicates().reset_index(drop=True)
+    grid["cell_lat"] = snap_to_grid(grid["latitude"].to_numpy(), resolution)
+    grid["cell_lon"] = snap_to_grid(grid["longitude"].to_numpy(), resolution)
+    return grid
+
+
+def unique_cells(grid: pd.DataFrame) -> list:
+    cells = grid[["cell_lat", "cell_lon"]].drop_duplicates()
+    return list(zip(cells["cell_lat"], cells["cell_lon"]))
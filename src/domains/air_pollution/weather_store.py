@@ -0,0 +1,68 @@
+import os
+import threading
+import pandas as pd
+from typing import List, Tuple
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+DEFAULT_STORE_DIR = os.path.join(PROJECT_ROOT, "data", "air_pollution", "weather_cache")
+COORD_DECIMALS = 4
+HOURS_PER_DAY = 24
+
+
+class WeatherStore:
+    def __init__(self, root: str = DEFAULT_STORE_DIR, decimals: int = COORD_DECIMALS, columns: List[str] = None):
+        self.root = root
+        self.decimals = decimals
+        self.columns = columns or ["temperature", "humidity", "wind_speed", "pressure"]
+        self.lock = threading.Lock()
+
+    def key(self, lat: float, lon: float) -> Tuple[float, float]:
+        return round(float(lat), self.decimals), round(float(lon), self.decimals)
+
+    def path(self, lat: float, lon: float) -> str:
+        lat, lon = self.key(lat, lon)
+        return os.path.join(self.root, f"{lat:.{self.decimals}f}_{lon:.{self.decimals}f}.csv")
+
+    def load(self, lat: float, lon: float) -> pd.DataFrame:
+        path = self.path(lat, lon)
+        if not os.path.exists(path):
+            empty = pd.DataFrame({col: pd.Series(dtype="float64") for col in self.columns})
+            empty.insert(0, "datetime", pd.Series(dtype="datetime64[ns]"))
+            return empty
+        return pd.read_csv(path, parse_dates=["datetime"])
+
+    def covered_dates(self, lat: float, lon: float) -> pd.DatetimeIndex:
+        stored = self.load(lat, lon)
+        hours = stored["datetime"].dt.normalize().value_counts()
+        return pd.DatetimeIndex(hours[hours >= HOURS_PER_DAY].index)
+
+    def missing_ranges(self, lat: float, lon: float, start: str, end: str) -> List[Tuple[str, str]]:
+        wanted = pd.date_range(start, end, freq="D")
+        missing = wanted.difference(self.covered_dates(lat, lon))
+        if missing.empty:
+            return []
+
+        # Split the missing days into runs of consecutive dates, one request per run
+        run_ids = (missing.to_series().diff() != pd.Timedelta(days=1)).cumsum()
+        return [
+            (run.min().strftime("%Y-%m-%d"), run.max().strftime("%Y-%m-%d"))
+            for _, run in missing.to_series().groupby(run_ids.values)
+        ]
+
+    def append(self, lat: float, lon: float, hourly_df: pd.DataFrame):
+        # Hours the archive has not published yet come back as NaN and must stay missing
+        fresh = hourly_df[["datetime"] + self.columns].dropna(subset=self.columns, how="any")
+        if fresh.empty:
+            return
+
+        with self.lock:
+            os.makedirs(self.root, exist_ok=True)
+            stored = self.load(lat, lon)
+            merged = pd.concat([stored, fresh], ignore_index=True)
+            merged = merged.drop_duplicates(subset="datetime", keep="last").sort_values("datetime")
+            merged.to_csv(self.path(lat, lon), index=False)
+
+    def read(self, lat: float, lon: float, start: str, end: str) -> pd.DataFrame:
+        stored = self.load(lat, lon)
+        day = stored["datetime"].dt.normalize()
+        return stored[(day >= pd.Timestamp(start)) & (day <= pd.Timestamp(end))].reset_index(drop=True)
@@ -0,0 +1,77 @@
+import os
+import shutil
+import logging
+import pandas as pd
+from typing import List
+
+from src.domains.traffic.filter_data import filter_and_sort_traffic_data
+from src.preprocess.feature_selector import enforce_schema
+from src.storage.frame_store import append_frame, iter_frame, read_frame, remove_frame
+
+DEFAULT_MEMORY_BUDGET = 512 * 1024 ** 2
+SAMPLE_ROWS = 10_000
+# The raw chunk, its parsed copy and the spill writes all live at once
+CHUNK_SHARE = 4
+
+logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+
+
+def estimate_row_bytes(path: str) -> float:
+    sample = next(iter_frame(path, batch_rows=SAMPLE_ROWS), None)
+    if sample is None or sample.empty:
+        return 1.0
+    return sample.memory_usage(deep=True).sum() / len(sample)
+
+
+def spill_chunk(chunk: pd.DataFrame, spill_dir: str, frequency: str) -> int:
+    chunk = chunk.rename(columns={"timestamp": "date"})
+    chunk["date"] = pd.to_datetime(chunk["date"], format="ISO8601", utc=True)
+    chunk = enforce_schema(chunk[(chunk["lat"] != 0.0) & (chunk["long"] != 0.0)], "traffic")
+
+    # Duplicates share a date, so every (date, site_id) key lands in exactly one partition
+    for period, rows in chunk.groupby(chunk["date"].dt.floor(frequency), sort=False):
+        append_frame(rows, os.path.join(spill_dir, f"{period:%Y%m%d%H%M}.parquet"))
+    return len(chunk)
+
+
+def merge_traffic_files_chunked(
+    input_dir: str,
+    files: List[str],
+    output_path: str,
+    memory_budget: int = DEFAULT_MEMORY_BUDGET,
+    frequency: str = "D"
+) -> int:
+    if not files:
+        raise FileNotFoundError(f"No raw traffic files found in {input_dir}")
+
+    spill_dir = output_path + ".spill"
+    shutil.rmtree(spill_dir, ignore_errors=True)
+    os.makedirs(spill_dir)
+    remove_frame(output_path)
+
+    row_bytes = estimate_row_bytes(os.path.join(input_dir, files[0]))
+    chunk_rows = max(SAMPLE_ROWS, int(memory_budget / CHUNK_SHARE / row_bytes))
+    logging.info(f"Streaming {len(files)} raw files in chunks of {chunk_rows} rows "
+                 f"(budget {memory_budget / 1024 ** 2:.0f} MB)")
+
+    try:
+        # Files and chunks are spilled in order, so "first occurrence wins" matches the in-memory merge
+        kept = 0
+        for file in files:
+            for chunk in iter_frame(os.path.join(input_dir, file), batch_rows=chunk_rows):
+                kept += spill_chunk(chunk, spill_dir, frequency)
+
+        written = 0
+        for name in sorted(os.listdir(spill_dir)):
+            partition = filter_and_sort_traffic_data(read_frame(os.path.join(spill_dir, name)))
+            partition_bytes = partition.memory_usage(deep=True).sum()
+            if partition_bytes > memory_budget:
+                logging.warning(f"Partition {name} needs {partition_bytes / 1024 ** 2:.0f} MB, over the memory budget; "
+                                f"use a finer partition frequency")
+            append_frame(partition, output_path)
+            written += len(partition)
+    finally:
+        shutil.rmtree(spill_dir, ignore_errors=True)
+
+    logging.info(f"Kept {kept} rows after the coordinate filter, {written} after dropping duplicates")
+    return written
@@ -1,110 +1,303 @@
 import os
-import time
+import json
 import logging
+import threading
 import requests
+import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+
+from src.domains.rate_limiter import TokenBucket
+from src.storage.frame_store import write_frame, write_frame_chunks
 
 BASE_URL = "http://api.glasgow.gov.uk/traffic/v1/movement/history"
 STEP = timedelta(days=7)
-SLEEP_WEEKS = 60
-SLEEP_PAGES = 5
 PAGE_SIZE = 100
 RETRY_LIMIT = 3
 REQUEST_TIMEOUT = 90
+MAX_WORKERS = 4
+REQUESTS_PER_SECOND = 0.5
+BACKOFF_SECONDS = 10
+CHECKPOINT_FILE = ".glasgow_traffic_checkpoint.json"
+# Staged rows are compacted a few pages at a time, so a week never has to fit in memory
+COMPACT_CHUNK_ROWS = 10 * PAGE_SIZE
+STAGING_DTYPES = {"site_id": str, "lat": np.float64, "long": np.float64, "flow": np.int64, "concentration": np.float64}
 
 logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
 
-def fetch_glasgow_traffic(start_date: datetime, end_date: datetime, output_path: str):
-    all_data = []
+def create_session(pool_size: int = MAX_WORKERS) -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update({
+        "User-Agent": "Mozilla/5.0",
+        "Accept": "application/json",
+        "Connection": "keep-alive"
+    })
+    return session
+
+def week_windows(start_date: datetime, end_date: datetime) -> List[Tuple[datetime, datetime]]:
+    windows = []
     current = start_date
+    while current < end_date:
+        windows.append((current, min(current + STEP, end_date)))
+        current += STEP
+    return windows
+
+def backoff_seconds(attempt: int, response: Optional[requests.Response] = None) -> float:
+    if response is not None:
+        try:
+            return float(response.headers["Retry-After"])
+        except (KeyError, ValueError):
+            pass
+    return BACKOFF_SECONDS * 2 ** (attempt - 1)
+
+def fetch_page(
+    session: requests.Session,
+    limiter: TokenBucket,
+    week_start: datetime,
+    week_end: datetime,
+    page: int,
+    base_url: str = BASE_URL
+) -> Optional[list]:
+    params = {
+        "page": page,
+        "size": PAGE_SIZE,
+        "format": "json",
+        "start": week_start.isoformat() + "Z",
+        "end": week_end.isoformat() + "Z"
+    }
+
+    for attempt in range(1, RETRY_LIMIT + 1):
+        limiter.acquire()
+        try:
+            response = session.get(base_url, params=params, timeout=REQUEST_TIMEOUT)
+            if response.status_code == 429:
+                retry_after = backoff_seconds(attempt, response)
+                logging.warning(f"Rate limited on {week_start.date()}, page {page} (attempt {attempt}), "
+                                f"backing off {retry_after:.1f}s")
+                limiter.throttle(retry_after)
+                continue
+
+            response.raise_for_status()
+            limiter.succeed()
+            return response.json()
+
+        except requests.exceptions.ReadTimeout:
+            logging.warning(f"Read timeout on {week_start.date()}, page {page} (attempt {attempt})")
+            limiter.throttle(backoff_seconds(attempt))
+
+        except requests.exceptions.RequestException as e:
+            logging.warning(f"Request error on {week_start.date()}, page {page} (attempt {attempt}): {e}")
+            limiter.throttle(backoff_seconds(attempt))
+
+    logging.error(f"Failed to fetch page {page} for {week_start.date()} after {RETRY_LIMIT} attempts")
+    return None
+
+def fetch_week(
+    session: requests.Session,
+    limiter: TokenBucket,
+    week_start: datetime,
+    week_end: datetime,
+    on_page: Callable[[int, list], None],
+    base_url: str = BASE_URL,
+    stop: Optional[threading.Event] = None,
+    start_page: int = 1
+) -> bool:
+    page = start_page
+    logging.info(f"Fetching data: {week_start.date()} to {week_end.date()} from page {page}")
+
+    while stop is None or not stop.is_set():
+        data = fetch_page(session, limiter, week_start, week_end, page, base_url)
+        if data is None:
+            return False
+        if not data:
+            logging.info(f"No more data for {week_start.date()}, page {page}")
+            return True
+
+        on_page(page, data)
+        logging.info(f"Retrieved {len(data)} records ({week_start.date()}, page {page})")
+        page += 1
+
+    return False
+
+def nested_frame(values: pd.Series, fields: List[str]) -> pd.DataFrame:
+    return pd.DataFrame.from_records([value if isinstance(value, dict) else {} for value in values], columns=fields)
+
+def parse_traffic_records(records: list) -> pd.DataFrame:
+    # One frame per nesting level, built from the records directly; missing fields come back as NaN
+    # and take the API defaults when each column is converted
+    top = pd.DataFrame.from_records(records, columns=["timestamp", "site", "flow", "concentration"])
+    site = nested_frame(top["site"], ["siteId", "from"])
+    origin = nested_frame(site["from"], ["lat", "long"])
+
+    return pd.DataFrame({
+        "timestamp": pd.to_datetime(top["timestamp"], format="ISO8601", utc=True),
+        "site_id": site["siteId"].fillna("").to_numpy(dtype=object),
+        "lat": pd.to_numeric(origin["lat"]).fillna(0).to_numpy(dtype=np.float64),
+        "long": pd.to_numeric(origin["long"]).fillna(0).to_numpy(dtype=np.float64),
+        "flow": pd.to_numeric(top["flow"]).fillna(0).to_numpy(dtype=np.float64).astype(np.int64),
+        "concentration": pd.to_numeric(top["concentration"]).fillna(0).to_numpy(dtype=np.float64)
+    })
+
+def fetch_glasgow_traffic(
+    start_date: datetime,
+    end_date: datetime,
+    output_path: str,
+    max_workers: int = MAX_WORKERS,
+    requests_per_second: float = REQUESTS_PER_SECOND,
+    base_url: str = BASE_URL
+):
+    frames = []
+    session = create_session(max_workers)
+    limiter = TokenBucket(requests_per_second, burst=max_workers)
+    stop = threading.Event()
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def on_page(page, data):
+        frames.append(parse_traffic_records(data))
 
     try:
-        while current < end_date:
-            week_start = current
-            week_end = min(current + STEP, end_date)
-            page = 1
-            logging.info(f"Fetching data: {week_start.date()} to {week_end.date()}")
-
-            while True:
-                retry_count = 0
-                while retry_count < RETRY_LIMIT:
-                    try:
-                        session = requests.Session()
-                        session.headers.update({
-                            "User-Agent": "Mozilla/5.0",
-                            "Accept": "application/json",
-                            "Connection": "keep-alive"
-                        })
-
-                        params = {
-                            "page": page,
-                            "size": PAGE_SIZE,
-                            "format": "json",
-                            "start": week_start.isoformat() + "Z",
-                            "end": week_end.isoformat() + "Z"
-                        }
-
-                        response = session.get(BASE_URL, params=params, timeout=REQUEST_TIMEOUT)
-                        response.raise_for_status()
-                        data = response.json()
-
-                        if not data:
-                            logging.info(f"No more data for {week_start.date()}, page {page}")
-                            break
-
-                        all_data.extend(data)
-                        logging.info(f"Retrieved {len(data)} records (page {page})")
-                        page += 1
-                        time.sleep(SLEEP_PAGES)
-                        break
-
-                    except requests.exceptions.ReadTimeout:
-                        retry_count += 1
-                        logging.warning(f"Read timeout on {week_start.date()}, page {page} (attempt {retry_count})")
-                        time.sleep(10)
-
-                    except requests.exceptions.RequestException as e:
-                        retry_count += 1
-                        logging.warning(f"Request error on {week_start.date()}, page {page} (attempt {retry_count}): {e}")
-                        time.sleep(10)
-
-                else:
-                    logging.error(f"Failed to fetch page {page} for {week_start.date()} after {RETRY_LIMIT} attempts")
-                    break
-
-                if data == []:
-                    break
-
-            logging.info(f"Sleeping {SLEEP_WEEKS} seconds before the next batch...\n")
-            time.sleep(SLEEP_WEEKS)
-            current += STEP
+        futures = {
+            executor.submit(fetch_week, session, limiter, week_start, week_end, on_page, base_url, stop): week_start
+            for week_start, week_end in week_windows(start_date, end_date)
+        }
+        for future in as_completed(futures):
+            status = "complete" if future.result() else "incomplete"
+            logging.info(f"Finished week {futures[future].date()} ({status})")
 
     finally:
-        if all_data:
-            parsed = []
-            for item in all_data:
-                site = item.get("site", {})
-                site_id = site.get("siteId", "")
-                from_info = site.get("from", {})
-                lat = from_info.get("lat", 0)
-                lon = from_info.get("long", 0)
-
-                parsed.append({
-                    "timestamp": item.get("timestamp"),
-                    "site_id": site_id,
-                    "lat": lat,
-                    "long": lon,
-                    "flow": int(item.get("flow", 0)),
-                    "concentration": item.get("concentration", 0)
-                })
-
-            df = pd.DataFrame(parsed)
-            df["timestamp"] = pd.to_datetime(df["timestamp"])
+        # Let in-flight pages finish so partial weeks are still saved
+        stop.set()
+        executor.shutdown(wait=True, cancel_futures=True)
+        session.close()
+
+        if frames:
+            df = pd.concat(frames, ignore_index=True)
             df = df.sort_values(by=["timestamp", "site_id"])
 
             os.makedirs(os.path.dirname(output_path), exist_ok=True)
-            df.to_csv(output_path, index=False)
+            write_frame(df, output_path)
             logging.info(f"Saved partial data to: {output_path}")
         else:
             logging.warning("No data was collected. Nothing to save.")
+
+class StreamCheckpoint:
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.weeks: Dict[str, Dict] = {}
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                self.weeks = json.load(f)["weeks"]
+
+    def get(self, week_start: datetime) -> Optional[Dict]:
+        return self.weeks.get(week_start.isoformat())
+
+    def update(self, week_start: datetime, page: int, done: bool = False, size: int = 0):
+        with self.lock:
+            self.weeks[week_start.isoformat()] = {"page": page, "done": done, "size": size}
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"weeks": self.weeks}, f, indent=2)
+            os.replace(tmp_path, self.path)
+
+def week_partition_path(output_dir: str, week_start: datetime) -> str:
+    return os.path.join(output_dir, f"glasgow_traffic_{week_start:%Y%m%d}.parquet")
+
+def week_staging_path(output_dir: str, week_start: datetime) -> str:
+    # Hidden and without a raw suffix, so the collection pipeline never picks up a partial week
+    return os.path.join(output_dir, f".glasgow_traffic_{week_start:%Y%m%d}.csv.part")
+
+def read_staged_chunks(staging_path: str):
+    for chunk in pd.read_csv(staging_path, dtype=STAGING_DTYPES, chunksize=COMPACT_CHUNK_ROWS):
+        chunk["timestamp"] = pd.to_datetime(chunk["timestamp"], format="ISO8601", utc=True)
+        yield chunk
+
+def compact_week(staging_path: str, partition_path: str):
+    if not os.path.exists(staging_path):
+        return
+    # Rows stay in download order; every reader of the raw partitions sorts by date and site itself
+    write_frame_chunks(read_staged_chunks(staging_path), partition_path)
+
+def stream_week(
+    session: requests.Session,
+    limiter: TokenBucket,
+    checkpoint: StreamCheckpoint,
+    week_start: datetime,
+    week_end: datetime,
+    output_dir: str,
+    base_url: str = BASE_URL,
+    stop: Optional[threading.Event] = None
+) -> bool:
+    partition_path = week_partition_path(output_dir, week_start)
+    staging_path = week_staging_path(output_dir, week_start)
+    state = checkpoint.get(week_start)
+
+    if state is not None and state["done"]:
+        logging.info(f"Week {week_start.date()} already downloaded, skipping")
+        return True
+    staged_size = os.path.getsize(staging_path) if os.path.exists(staging_path) else 0
+    if state is None or state["size"] > staged_size:
+        # Fewer rows than checkpointed cannot be trusted; start the week over
+        if os.path.exists(staging_path):
+            os.remove(staging_path)
+        state = None
+    elif staged_size > state["size"]:
+        # A page appended after the last checkpoint is cut off here and downloaded again below
+        with open(staging_path, "r+b") as f:
+            f.truncate(state["size"])
+
+    def on_page(page, data):
+        df = parse_traffic_records(data)
+        df.to_csv(staging_path, mode="a", header=not os.path.exists(staging_path), index=False)
+        checkpoint.update(week_start, page, size=os.path.getsize(staging_path))
+
+    start_page = state["page"] + 1 if state is not None else 1
+    done = fetch_week(session, limiter, week_start, week_end, on_page, base_url, stop, start_page)
+    if done:
+        compact_week(staging_path, partition_path)
+        state = checkpoint.get(week_start)
+        checkpoint.update(week_start, state["page"] if state else 0, done=True, size=state["size"] if state else 0)
+        if os.path.exists(staging_path):
+            os.remove(staging_path)
+    return done
+
+def stream_glasgow_traffic(
+    start_date: datetime,
+    end_date: datetime,
+    output_dir: str,
+    max_workers: int = MAX_WORKERS,
+    requests_per_second: float = REQUESTS_PER_SECOND,
+    base_url: str = BASE_URL
+) -> bool:
+    os.makedirs(output_dir, exist_ok=True)
+    checkpoint = StreamCheckpoint(os.path.join(output_dir, CHECKPOINT_FILE))
+    session = create_session(max_workers)
+    limiter = TokenBucket(requests_per_second, burst=max_workers)
+    stop = threading.Event()
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    completed = True
+
+    try:
+        futures = {
+            executor.submit(stream_week, session, limiter, checkpoint, week_start, week_end, output_dir, base_url, stop): week_start
+            for week_start, week_end in week_windows(start_date, end_date)
+        }
+        for future in as_completed(futures):
+            done = future.result()
+            completed = completed and done
+            logging.info(f"Finished week {futures[future].date()} ({'complete' if done else 'incomplete'})")
+
+    finally:
+        stop.set()
+        executor.shutdown(wait=True, cancel_futures=True)
+        session.close()
+
+    if not completed:
+        logging.warning(f"Some weeks are incomplete; rerun to resume from {checkpoint.path}")
+    return completed
@@ -1,50 +1,78 @@
+import logging
+import numpy as np
 import pandas as pd
-from tqdm import tqdm
+from typing import Optional, Sequence
 
-def fill_missing_traffic_data(df: pd.DataFrame) -> pd.DataFrame:
-    df['timestamp'] = pd.to_datetime(df['timestamp'])
-    df['date'] = df['timestamp'].dt.date
+from src.preprocess.feature_selector import enforce_schema
 
-    full_dates = df['date'].unique()
-    full_sites = df['site_id'].unique()
+SLOT_OFFSETS = pd.to_timedelta(["0h", "12h"])
+MATCH_TOLERANCE = pd.Timedelta(seconds=60)
+COORD_COLUMNS = ["lat", "long"]
 
-    filled_data = []
+logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
 
-    progress_bar = tqdm(total=len(full_dates) * len(full_sites), desc="Imputing missing data")
 
-    for date in full_dates:
-        for site in full_sites:
-            site_day_data = df[(df['date'] == date) & (df['site_id'] == site)]
+def mode_from_counts(counts: pd.DataFrame, col: str, site_col: str = "site_id") -> pd.Series:
+    # Highest count wins, ties go to the smallest value as with Series.mode()
+    counts = counts.sort_values([site_col, "count", col], ascending=[True, False, True])
+    return counts.drop_duplicates(site_col).set_index(site_col)[col]
 
-            if site_day_data.shape[0] == 2:
-                filled_data.append(site_day_data)
-            else:
-                times = sorted(site_day_data['timestamp'].dt.time.unique())
-                if len(times) == 1:
-                    timestamps = [pd.Timestamp.combine(pd.Timestamp(date), times[0]), pd.Timestamp.combine(pd.Timestamp(date), times[0])]
-                else:
-                    timestamps = pd.date_range(start=pd.Timestamp(date), periods=2, freq="12h")
 
-                site_subset = df[df['site_id'] == site]
-                site_avg = site_subset.mean(numeric_only=True)
+def site_mode(df: pd.DataFrame, col: str, site_col: str = "site_id") -> pd.Series:
+    counts = df.groupby([site_col, col], observed=True).size().rename("count").reset_index()
+    return mode_from_counts(counts, col, site_col)
 
-                for ts in timestamps:
-                    if not any(abs((site_day_data['timestamp'] - ts).dt.total_seconds()) < 60):
-                        new_row = {
-                            'timestamp': ts,
-                            'site_id': site,
-                            'lat': site_subset['lat'].mode().iloc[0] if not site_subset['lat'].isna().all() else None,
-                            'long': site_subset['long'].mode().iloc[0] if not site_subset['long'].isna().all() else None,
-                            **{col: site_avg[col] for col in site_avg.index if col not in ['lat', 'long']}
-                        }
-                        site_day_data = pd.concat([site_day_data, pd.DataFrame([new_row])], ignore_index=True)
 
-                filled_data.append(site_day_data)
+def compute_site_aggregates(df: pd.DataFrame, site_col: str = "site_id") -> pd.DataFrame:
+    value_cols = [col for col in df.select_dtypes("number").columns if col not in COORD_COLUMNS]
+    aggregates = df.groupby(site_col, observed=True)[value_cols].mean()
 
-            progress_bar.update(1)
+    for col in COORD_COLUMNS:
+        aggregates[col] = site_mode(df, col, site_col)
 
-    progress_bar.close()
+    return aggregates
 
-    final_df = pd.concat(filled_data, ignore_index=True)
-    final_df = final_df.sort_values(by=["timestamp", "site_id"]).reset_index(drop=True)
-    return final_df
+
+def fill_missing_traffic_data(
+    df: pd.DataFrame,
+    key: str = "date",
+    site_aggregates: Optional[pd.DataFrame] = None,
+    sites: Optional[Sequence] = None
+) -> pd.DataFrame:
+    df = enforce_schema(df.copy(), "traffic")
+    df[key] = pd.to_datetime(df[key])
+    day = df[key].dt.normalize()
+
+    dates = day.unique()
+    if sites is None:
+        sites = df["site_id"].unique()
+
+    # A site-day needs imputation unless it already has two rows or a single repeated time of day
+    observed = pd.DataFrame({"site_id": df["site_id"], "day": day, "offset": df[key] - day})
+    per_day = observed.groupby(["site_id", "day"], observed=True)["offset"].agg(["size", "nunique"])
+    grid = per_day.reindex(pd.MultiIndex.from_product([sites, dates], names=["site_id", "day"]), fill_value=0)
+    incomplete = grid[(grid["size"] != 2) & (grid["nunique"] != 1)].index.to_frame(index=False)
+
+    slots = incomplete.loc[incomplete.index.repeat(len(SLOT_OFFSETS))].reset_index(drop=True)
+    slots["slot"] = slots["day"] + np.tile(SLOT_OFFSETS, len(incomplete))
+
+    # A slot is taken when the same site-day already has a record within a minute of it
+    candidates = slots.reset_index().merge(observed, on=["site_id", "day"], how="inner")
+    taken = candidates.loc[(candidates["slot"] - candidates["day"] - candidates["offset"]).abs() < MATCH_TOLERANCE, "index"]
+    missing = slots.drop(index=taken.unique())
+
+    logging.info(f"Imputing {len(missing)} missing records across {len(sites)} sites and {len(dates)} days")
+
+    if missing.empty:
+        return enforce_schema(df.sort_values(by=[key, "site_id"]).reset_index(drop=True), "traffic")
+
+    if site_aggregates is None:
+        site_aggregates = compute_site_aggregates(df)
+
+    imputed = site_aggregates.reindex(missing["site_id"].to_numpy()).reset_index(drop=True)
+    imputed.insert(0, "site_id", missing["site_id"].to_numpy())
+    imputed.insert(0, key, missing["slot"].to_numpy())
+
+    final_df = pd.concat([df, imputed], ignore_index=True)
+    final_df = final_df.sort_values(by=[key, "site_id"]).reset_index(drop=True)
+    return enforce_schema(final_df, "traffic")
@@ -0,0 +1,98 @@
+import os
+import json
+import logging
+import pandas as pd
+from typing import Dict, List, Optional, Tuple
+
+from src.domains.traffic.fill_missing_data import COORD_COLUMNS, mode_from_counts
+from src.domains.traffic.merge_csv_files import RAW_SUFFIXES
+
+MANIFEST_FILE = "raw_manifest.json"
+VALUE_TOTALS_FILE = "site_value_totals.csv"
+COORD_COUNTS_FILE = "site_coord_counts.csv"
+
+logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+
+
+def load_raw_manifest(output_dir: str) -> Optional[Dict]:
+    manifest_path = os.path.join(output_dir, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, "r") as f:
+        return json.load(f)
+
+
+def save_raw_manifest(output_dir: str, input_dir: str, files: List[str], last_date: pd.Timestamp, manifest: Optional[Dict] = None):
+    manifest = manifest or {"files": {}}
+    for file in files:
+        stat = os.stat(os.path.join(input_dir, file))
+        manifest["files"][file] = {"size": stat.st_size, "mtime": stat.st_mtime}
+    manifest["last_date"] = pd.Timestamp(last_date).isoformat()
+
+    with open(os.path.join(output_dir, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+
+def find_new_raw_files(input_dir: str, manifest: Optional[Dict]) -> List[str]:
+    seen = manifest["files"] if manifest else {}
+    new_files = []
+    for file in sorted(os.listdir(input_dir)):
+        if not file.endswith(RAW_SUFFIXES):
+            continue
+        stat = os.stat(os.path.join(input_dir, file))
+        entry = seen.get(file)
+        if entry is None or entry["size"] != stat.st_size or entry["mtime"] != stat.st_mtime:
+            new_files.append(file)
+    return new_files
+
+
+def compute_running_totals(df: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    value_cols = [col for col in df.select_dtypes("number").columns if col not in COORD_COLUMNS]
+
+    grouped = df.groupby("site_id", observed=True)[value_cols]
+    value_totals = pd.concat(
+        [grouped.sum().stack().rename("sum"), grouped.count().stack().rename("count")],
+        axis=1
+    )
+    value_totals.index.names = ["site_id", "column"]
+
+    coord_counts = pd.concat(
+        [df.groupby(["site_id", col], observed=True).size().rename_axis(["site_id", "value"]) for col in COORD_COLUMNS],
+        keys=COORD_COLUMNS,
+        names=["coord"]
+    ).rename("count").reorder_levels(["site_id", "coord", "value"])
+
+    return value_totals.reset_index(), coord_counts.reset_index()
+
+
+def has_running_totals(output_dir: str) -> bool:
+    return all(os.path.exists(os.path.join(output_dir, f)) for f in [VALUE_TOTALS_FILE, COORD_COUNTS_FILE])
+
+
+def update_running_totals(output_dir: str, df: pd.DataFrame, reset: bool = False) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    value_totals, coord_counts = compute_running_totals(df)
+
+    value_path = os.path.join(output_dir, VALUE_TOTALS_FILE)
+    coord_path = os.path.join(output_dir, COORD_COUNTS_FILE)
+    if not reset and has_running_totals(output_dir):
+        value_totals = pd.concat([pd.read_csv(value_path), value_totals], ignore_index=True)
+        coord_counts = pd.concat([pd.read_csv(coord_path), coord_counts], ignore_index=True)
+
+    value_totals = value_totals.groupby(["site_id", "column"], as_index=False)[["sum", "count"]].sum()
+    coord_counts = coord_counts.groupby(["site_id", "coord", "value"], as_index=False)["count"].sum()
+
+    value_totals.to_csv(value_path, index=False)
+    coord_counts.to_csv(coord_path, index=False)
+    return value_totals, coord_counts
+
+
+def site_aggregates_from_totals(value_totals: pd.DataFrame, coord_counts: pd.DataFrame) -> pd.DataFrame:
+    totals = value_totals.set_index(["site_id", "column"])
+    aggregates = (totals["sum"] / totals["count"]).unstack("column")
+    aggregates.columns.name = None
+
+    for col in COORD_COLUMNS:
+        counts = coord_counts[coord_counts["coord"] == col].rename(columns={"value": col})
+        aggregates[col] = mode_from_counts(counts, col)
+
+    return aggregates
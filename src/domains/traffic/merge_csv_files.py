@@ -1,13 +1,20 @@
 import os
 import pandas as pd
+from typing import List, Optional
 
-def merge_traffic_csv_files(input_dir: str) -> pd.DataFrame:
-    all_files = [f for f in os.listdir(input_dir) if f.endswith(".csv")]
+from src.storage.frame_store import read_frame
+
+RAW_SUFFIXES = (".csv", ".parquet")
+
+def merge_traffic_csv_files(input_dir: str, files: Optional[List[str]] = None) -> pd.DataFrame:
+    all_files = files if files is not None else [f for f in os.listdir(input_dir) if f.endswith(RAW_SUFFIXES)]
     if not all_files:
-        raise FileNotFoundError(f"No CSV files found in {input_dir}")
+        raise FileNotFoundError(f"No raw traffic files found in {input_dir}")
 
+    # CSV dumps carry ISO strings and parquet dumps UTC datetimes; both come back as UTC datetime64
     merged_df = pd.concat(
-        [pd.read_csv(os.path.join(input_dir, file)) for file in all_files],
+        [read_frame(os.path.join(input_dir, file), date_col="timestamp") for file in all_files],
         ignore_index=True
     )
+    merged_df["timestamp"] = pd.to_datetime(merged_df["timestamp"], utc=True)
     return merged_df
@@ -0,0 +1,187 @@
+import os
+import ast
+import json
+import time
+import shutil
+import hashlib
+import inspect
+import logging
+import importlib.util
+import pandas as pd
+from typing import Any, Callable, List, Optional
+
+from src.storage.frame_store import read_frame, write_frame
+
+STAGE_META = "stage.json"
+DEFAULT_MAX_ENTRIES = 2
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+
+
+def directory_fingerprint(path: str) -> str:
+    digest = hashlib.sha256()
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            file_path = os.path.join(root, name)
+            stat = os.stat(file_path)
+            digest.update(f"{os.path.relpath(file_path, path)}:{stat.st_size}:{stat.st_mtime_ns}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def describe_value(value: Any) -> Any:
+    # Frames are produced by earlier stages and already covered by the chained fingerprint
+    if isinstance(value, pd.DataFrame):
+        return "<frame>"
+    if isinstance(value, (list, tuple)):
+        return [describe_value(item) for item in value]
+    if isinstance(value, dict):
+        return {str(key): describe_value(item) for key, item in value.items()}
+    return value
+
+
+def project_file(path: Optional[str]) -> Optional[str]:
+    if not path or not path.endswith(".py"):
+        return None
+    path = os.path.abspath(path)
+    return path if path.startswith(PROJECT_ROOT + os.sep) else None
+
+
+def imported_files(path: str) -> List[str]:
+    with open(path, "r", encoding="utf-8") as f:
+        tree = ast.parse(f.read(), filename=path)
+
+    names = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and node.level == 0:
+            # "from package import name" may name a submodule as well as an attribute
+            names.append(node.module)
+            names.extend(f"{node.module}.{alias.name}" for alias in node.names)
+
+    files = []
+    for module_name in names:
+        try:
+            spec = importlib.util.find_spec(module_name)
+        except (ImportError, ValueError):
+            continue
+        module_file = project_file(spec.origin if spec else None)
+        if module_file:
+            files.append(module_file)
+    return files
+
+
+def code_fingerprint(func: Callable) -> str:
+    # Every project module reachable through imports, so edits to helpers and data modules like
+    # the station list invalidate the stage, not only edits to the stage function itself
+    pending = [project_file(inspect.getsourcefile(func))]
+    seen = set()
+    while pending:
+        path = pending.pop()
+        if path is None or path in seen:
+            continue
+        seen.add(path)
+        pending.extend(imported_files(path))
+
+    digest = hashlib.sha256(inspect.getsource(func).encode("utf-8"))
+    for path in sorted(seen):
+        with open(path, "rb") as f:
+            digest.update(os.path.relpath(path, PROJECT_ROOT).encode("utf-8"))
+            digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()
+
+
+def stage_fingerprint(name: str, func: Callable, upstream: str, args: tuple, kwargs: dict) -> str:
+    payload = {
+        "stage": name,
+        "code": code_fingerprint(func),
+        "upstream": upstream,
+        "args": describe_value(args),
+        "kwargs": describe_value(kwargs),
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:16]
+
+
+def save_outputs(stage_dir: str, result: Any):
+    os.makedirs(stage_dir, exist_ok=True)
+    outputs = result if isinstance(result, tuple) else (result,)
+
+    kinds = []
+    for i, value in enumerate(outputs):
+        if isinstance(value, pd.DataFrame):
+            write_frame(value, os.path.join(stage_dir, f"output-{i}.parquet"))
+            kinds.append("frame")
+        else:
+            with open(os.path.join(stage_dir, f"output-{i}.json"), "w") as f:
+                json.dump(value, f, indent=2)
+            kinds.append("json")
+
+    # Written last, so an interrupted stage never looks cached
+    with open(os.path.join(stage_dir, STAGE_META), "w") as f:
+        json.dump({"kinds": kinds, "tuple": isinstance(result, tuple)}, f, indent=2)
+
+
+def load_outputs(stage_dir: str, meta: dict) -> Any:
+    outputs = []
+    for i, kind in enumerate(meta["kinds"]):
+        if kind == "frame":
+            outputs.append(read_frame(os.path.join(stage_dir, f"output-{i}.parquet")))
+        else:
+            with open(os.path.join(stage_dir, f"output-{i}.json"), "r") as f:
+                outputs.append(json.load(f))
+    return tuple(outputs) if meta["tuple"] else outputs[0]
+
+
+class PipelineRunner:
+    def __init__(self, cache_dir: str, sources: Optional[List[str]] = None, use_cache: bool = True, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.cache_dir = cache_dir
+        self.use_cache = use_cache
+        self.max_entries = max_entries
+        self.fingerprint = hashlib.sha256(
+            "".join(directory_fingerprint(path) for path in sources or []).encode("utf-8")
+        ).hexdigest()
+        self.timings = []
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def run(self, name: str, func: Callable, *args, **kwargs) -> Any:
+        start = time.perf_counter()
+        self.fingerprint = stage_fingerprint(name, func, self.fingerprint, args, kwargs)
+        stage_dir = os.path.join(self.cache_dir, f"{name}-{self.fingerprint}")
+        meta_path = os.path.join(stage_dir, STAGE_META)
+
+        if self.use_cache and os.path.exists(meta_path):
+            with open(meta_path, "r") as f:
+                result = load_outputs(stage_dir, json.load(f))
+            os.utime(meta_path)
+            status = "hit"
+        else:
+            result = func(*args, **kwargs)
+            if self.use_cache:
+                shutil.rmtree(stage_dir, ignore_errors=True)
+                save_outputs(stage_dir, result)
+                self.evict(name)
+            status = "miss" if self.use_cache else "off"
+
+        elapsed = time.perf_counter() - start
+        self.timings.append((name, status, elapsed))
+        logging.info(f"Stage '{name}': cache {status}, {elapsed:.2f}s")
+        return result
+
+    def evict(self, name: str):
+        entries = []
+        for entry in os.listdir(self.cache_dir):
+            meta_path = os.path.join(self.cache_dir, entry, STAGE_META)
+            if entry.rsplit("-", 1)[0] == name and os.path.exists(meta_path):
+                entries.append((os.path.getmtime(meta_path), entry))
+
+        for _, entry in sorted(entries, reverse=True)[self.max_entries:]:
+            shutil.rmtree(os.path.join(self.cache_dir, entry), ignore_errors=True)
+
+    def summary(self):
+        total = sum(elapsed for _, _, elapsed in self.timings)
+        logging.info("Pipeline stages:")
+        for name, status, elapsed in self.timings:
+            logging.info(f"  {name:<15} {status:<5} {elapsed:8.2f}s")
+        logging.info(f"  {'total':<15} {'':<5} {total:8.2f}s")
@@ -1,8 +1,13 @@
 import os
 import json
+import numpy as np
 import pandas as pd
 import logging
-from typing import List
+import pyarrow.parquet as pq
+from typing import Iterable, List, Optional, Sequence, Union
+from pandas.api.types import is_bool_dtype, is_datetime64_any_dtype, is_numeric_dtype
+
+from src.storage.frame_store import frame_columns, is_parquet, iter_frame, list_parts
 
 logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
 
@@ -13,35 +18,189 @@ NON_FEATURE_COLUMNS = {
     "energy": ["timestamp", "region", "latitude", "longitude"],
 }
 
+# Canonical dtypes of the non-feature columns; every other numeric column is a float32 feature
+COLUMN_SCHEMA = {
+    "air_pollution": {"date": "datetime64", "station_name": "category", "latitude": "float32", "longitude": "float32"},
+    "traffic": {"date": "datetime64", "site_id": "category", "lat": "float32", "long": "float32"},
+    "energy": {"timestamp": "datetime64", "region": "category", "latitude": "float32", "longitude": "float32"},
+}
+TIME_FEATURE_COLUMNS = ["dayofweek", "month", "day", "season", "is_weekend", "hour"]
+FEATURE_DTYPE = "float32"
+TIME_FEATURE_DTYPE = "int8"
 
-def select_features(df: pd.DataFrame, output_dir: str, dataset_type: str, threshold: float = 0.9) -> pd.DataFrame:
-    os.makedirs(output_dir, exist_ok=True)
 
-    if dataset_type not in NON_FEATURE_COLUMNS:
+def column_dtype(df: pd.DataFrame, col: str, schema: dict):
+    if col in schema:
+        return schema[col]
+    if col in TIME_FEATURE_COLUMNS and df[col].notna().all():
+        return TIME_FEATURE_DTYPE
+    if is_numeric_dtype(df[col]) and not is_bool_dtype(df[col]):
+        return FEATURE_DTYPE
+    return None
+
+
+def enforce_schema(df: pd.DataFrame, dataset_type: str) -> pd.DataFrame:
+    if dataset_type not in COLUMN_SCHEMA:
         raise ValueError(f"Unknown dataset_type: {dataset_type}")
 
+    schema = COLUMN_SCHEMA[dataset_type]
+    casts = {}
+    for col in df.columns:
+        dtype = column_dtype(df, col, schema)
+        if dtype == "datetime64":
+            # Timezone-aware timestamps keep their zone
+            if not is_datetime64_any_dtype(df[col]):
+                casts[col] = pd.to_datetime(df[col])
+        elif dtype == "category" and isinstance(df[col].dtype, pd.CategoricalDtype):
+            # Frames read back from several parts carry categories in first-seen order
+            categories = df[col].cat.categories
+            if not categories.is_monotonic_increasing:
+                casts[col] = df[col].cat.reorder_categories(categories.sort_values())
+        elif dtype is not None and df[col].dtype != dtype:
+            casts[col] = df[col].astype(dtype)
+
+    return df.assign(**casts) if casts else df
+
+
+def feature_columns(columns: Sequence[str], dataset_type: str) -> List[str]:
+    if dataset_type not in NON_FEATURE_COLUMNS:
+        raise ValueError(f"Unknown dataset_type: {dataset_type}")
     non_feature_cols = NON_FEATURE_COLUMNS[dataset_type]
-    feature_cols = [col for col in df.columns if col not in non_feature_cols]
+    return [col for col in columns if col not in non_feature_cols]
+
+
+def parquet_completeness(path: str, columns: List[str]) -> Optional[pd.Series]:
+    nulls = pd.Series(0, index=columns, dtype=np.int64)
+    rows = 0
+    for part in list_parts(path):
+        metadata = pq.ParquetFile(part).metadata
+        rows += metadata.num_rows
+        for i in range(metadata.num_row_groups):
+            row_group = metadata.row_group(i)
+            for j in range(row_group.num_columns):
+                chunk = row_group.column(j)
+                if chunk.path_in_schema not in nulls.index:
+                    continue
+                if chunk.statistics is None or not chunk.statistics.has_null_count:
+                    return None
+                nulls[chunk.path_in_schema] += chunk.statistics.null_count
+    return (rows - nulls) / rows if rows else None
+
+
+def feature_completeness(data: Union[pd.DataFrame, str], dataset_type: str) -> pd.Series:
+    if isinstance(data, pd.DataFrame):
+        return data[feature_columns(data.columns, dataset_type)].notna().mean()
+
+    feature_cols = feature_columns(frame_columns(data), dataset_type)
+
+    # Parquet footers already hold per-column null counts, so no data pages are read
+    if is_parquet(data):
+        completeness = parquet_completeness(data, feature_cols)
+        if completeness is not None:
+            return completeness
 
-    completeness = {
-        col: df[col].notnull().sum() / len(df) for col in feature_cols
-    }
+    rows = 0
+    non_null = pd.Series(0, index=feature_cols, dtype=np.int64)
+    for chunk in iter_frame(data, columns=feature_cols):
+        rows += len(chunk)
+        non_null += chunk.notna().sum()
+    return non_null / rows
 
-    selected_features: List[str] = [
-        col for col, ratio in completeness.items() if ratio >= threshold
-    ]
+
+def correlation_matrix(chunks: Iterable[pd.DataFrame], features: List[str]) -> pd.DataFrame:
+    # Co-moments of the rows where every feature is present, merged chunk by chunk like the scaler's moments
+    count = 0
+    mean = np.zeros(len(features))
+    comoment = np.zeros((len(features), len(features)))
+    for chunk in chunks:
+        values = chunk[features].to_numpy(dtype=np.float64)
+        values = values[~np.isnan(values).any(axis=1)]
+        if not len(values):
+            continue
+
+        chunk_mean = values.mean(axis=0)
+        centered = values - chunk_mean
+        total = count + len(values)
+        delta = chunk_mean - mean
+        comoment += centered.T @ centered + np.outer(delta, delta) * count * len(values) / total
+        mean += delta * len(values) / total
+        count = total
+
+    std = np.sqrt(np.diag(comoment))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        correlation = comoment / np.outer(std, std)
+    return pd.DataFrame(np.nan_to_num(correlation), index=features, columns=features)
+
+
+def prune_correlated(
+    data: Union[pd.DataFrame, str],
+    features: List[str],
+    max_correlation: float,
+    keep: Optional[List[str]] = None
+) -> List[str]:
+    chunks = [data] if isinstance(data, pd.DataFrame) else iter_frame(data, columns=features)
+    correlation = correlation_matrix(chunks, features).abs().to_numpy()
+
+    # Kept columns claim their slot first; the rest survive only if no kept column mirrors them
+    keep = [col for col in keep or [] if col in features]
+    order = [features.index(col) for col in keep] + [i for i, col in enumerate(features) if col not in keep]
+    kept = []
+    for i in order:
+        if features[i] in keep or not kept or correlation[i, kept].max() <= max_correlation:
+            kept.append(i)
+        else:
+            partner = features[kept[int(np.argmax(correlation[i, kept]))]]
+            logging.info(f"  dropping {features[i]}: |r| = {correlation[i, kept].max():.3f} with {partner}")
+
+    return [col for i, col in enumerate(features) if i in kept]
+
+
+def choose_features(
+    data: Union[pd.DataFrame, str],
+    dataset_type: str,
+    threshold: float = 0.9,
+    max_correlation: Optional[float] = None,
+    keep: Optional[List[str]] = None
+) -> List[str]:
+    completeness = feature_completeness(data, dataset_type)
+    selected_features: List[str] = completeness.index[completeness >= threshold].tolist()
 
     logging.info(f"[{dataset_type}] Feature fill ratios:")
-    for col in sorted(completeness, key=completeness.get, reverse=True):
-        logging.info(f"  {col}: {completeness[col]*100:.2f}%")
+    for col, ratio in completeness.sort_values(ascending=False, kind="stable").items():
+        logging.info(f"  {col}: {ratio*100:.2f}%")
 
     logging.info(f"[{dataset_type}] Selected features (≥ {int(threshold * 100)}%): {selected_features}")
 
+    if max_correlation is not None and len(selected_features) > 1:
+        logging.info(f"[{dataset_type}] Pruning features correlated above {max_correlation}:")
+        selected_features = prune_correlated(data, selected_features, max_correlation, keep)
+        logging.info(f"[{dataset_type}] Features after pruning: {selected_features}")
+
+    return selected_features
+
+
+def select_features(
+    df: pd.DataFrame,
+    output_dir: str,
+    dataset_type: str,
+    threshold: float = 0.9,
+    max_correlation: Optional[float] = None,
+    keep: Optional[List[str]] = None
+) -> pd.DataFrame:
+    os.makedirs(output_dir, exist_ok=True)
+    selected_features = choose_features(df, dataset_type, threshold, max_correlation, keep)
+
     with open(os.path.join(output_dir, "selected_features.json"), "w") as f:
         json.dump(selected_features, f, indent=2)
 
-    final_cols = non_feature_cols + selected_features
-    filtered_df = df[final_cols].copy()
-    filtered_df.dropna(subset=selected_features, how="all", inplace=True)
+    return apply_feature_selection(df, dataset_type, selected_features)
+
+
+def apply_feature_selection(df: pd.DataFrame, dataset_type: str, selected_features: List[str]) -> pd.DataFrame:
+    final_cols = NON_FEATURE_COLUMNS[dataset_type] + selected_features
+
+    # A plain projection when no row is empty; rows are filtered and projected in one step otherwise
+    has_values = df[selected_features].notna().any(axis=1)
+    filtered_df = df[final_cols] if has_values.all() else df.loc[has_values, final_cols]
 
-    return filtered_df
+    return enforce_schema(filtered_df, dataset_type)
@@ -1,20 +1,105 @@
+import json
+import numpy as np
 import pandas as pd
-from typing import List, Tuple, Optional, Dict
+from typing import Dict, Iterable, List, Optional, Tuple, Union
 
-def scale_features(df: pd.DataFrame, features: List[str], target: Optional[str] = None) -> Tuple[pd.DataFrame, Dict[str, Dict[str, float]]]:
-    scaler_params = {}
-    df_scaled = df.copy()
 
-    columns_to_scale = features + ([target] if target else [])
+class FeatureScaler:
+    def __init__(self, columns: List[str]):
+        self.columns = list(dict.fromkeys(columns))
+        self.count = np.zeros(len(self.columns))
+        self.mean = np.zeros(len(self.columns))
+        self.m2 = np.zeros(len(self.columns))
 
-    for col in columns_to_scale:
-        mean = df_scaled[col].mean()
-        std = df_scaled[col].std()
+    def partial_fit(self, df: pd.DataFrame) -> "FeatureScaler":
+        for i, col in enumerate(self.columns):
+            values = df[col].to_numpy(dtype=np.float64)
+            values = values[~np.isnan(values)]
+            if not len(values):
+                continue
 
-        if std == 0 or pd.isna(std):
-            std = 1.0
+            count = len(values)
+            mean = values.mean()
+            m2 = np.square(values - mean).sum()
 
-        df_scaled[col] = (df_scaled[col] - mean) / std
-        scaler_params[col] = {"mean": mean, "std": std}
+            # Chan et al. pairwise merge of the running moments with this chunk's
+            total = self.count[i] + count
+            delta = mean - self.mean[i]
+            self.mean[i] += delta * count / total
+            self.m2[i] += m2 + delta * delta * self.count[i] * count / total
+            self.count[i] = total
+        return self
 
-    return df_scaled, scaler_params
+    def fit(
+        self,
+        data: Union[pd.DataFrame, Iterable[pd.DataFrame]],
+        fit_end=None,
+        date_col: str = "date"
+    ) -> "FeatureScaler":
+        chunks = [data] if isinstance(data, pd.DataFrame) else data
+        for chunk in chunks:
+            if fit_end is not None:
+                # Only the training period contributes, so test rows never leak into the statistics
+                dates = chunk[date_col]
+                end = pd.Timestamp(fit_end)
+                if dates.dt.tz is not None and end.tzinfo is None:
+                    end = end.tz_localize(dates.dt.tz)
+                chunk = chunk[dates <= end]
+            self.partial_fit(chunk)
+        return self
+
+    @property
+    def params(self) -> Dict[str, Dict[str, float]]:
+        params = {}
+        for col, count, mean, m2 in zip(self.columns, self.count, self.mean, self.m2):
+            # Sample standard deviation (ddof=1), matching pandas
+            std = np.sqrt(m2 / (count - 1)) if count > 1 else np.nan
+            if std == 0 or np.isnan(std):
+                std = 1.0
+            params[col] = {"mean": float(mean) if count else float("nan"), "std": float(std)}
+        return params
+
+    def transform(self, df: pd.DataFrame, inplace: bool = False) -> pd.DataFrame:
+        # Columns are replaced one at a time, so no full copy of the frame is made
+        df = df if inplace else df.copy(deep=False)
+        for col, params in self.params.items():
+            values = df[col].to_numpy(dtype=np.float32, copy=True)
+            np.subtract(values, np.float32(params["mean"]), out=values)
+            np.divide(values, np.float32(params["std"]), out=values)
+            df[col] = values
+        return df
+
+    def inverse_transform(self, values: np.ndarray, column: str) -> np.ndarray:
+        params = self.params[column]
+        return np.asarray(values) * params["std"] + params["mean"]
+
+    def save(self, path: str):
+        with open(path, "w") as f:
+            json.dump(self.params, f, indent=2)
+
+    @classmethod
+    def from_params(cls, scaler_params: Dict[str, Dict[str, float]]) -> "FeatureScaler":
+        scaler = cls(list(scaler_params))
+        stds = np.array([scaler_params[col]["std"] for col in scaler.columns], dtype=np.float64)
+        scaler.mean = np.array([scaler_params[col]["mean"] for col in scaler.columns], dtype=np.float64)
+        # Two pseudo-observations reproduce the stored std exactly
+        scaler.count = np.full(len(scaler.columns), 2.0)
+        scaler.m2 = stds * stds
+        return scaler
+
+    @classmethod
+    def load(cls, path: str) -> "FeatureScaler":
+        with open(path, "r") as f:
+            return cls.from_params(json.load(f))
+
+
+def scale_features(
+    df: pd.DataFrame,
+    features: List[str],
+    target: Optional[str] = None,
+    fit_end=None,
+    date_col: str = "date"
+) -> Tuple[pd.DataFrame, Dict[str, Dict[str, float]]]:
+    scaler = FeatureScaler(features + ([target] if target else []))
+    scaler.fit(df, fit_end=fit_end, date_col=date_col)
+    return scaler.transform(df), scaler.params
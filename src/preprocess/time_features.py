@@ -1,25 +1,49 @@
+import numpy as np
 import pandas as pd
 
-def set_season(month: int) -> str:
-    if month in [12, 1, 2]:
-        return "winter"
-    elif month in [3, 4, 5]:
-        return "spring"
-    elif month in [6, 7, 8]:
-        return "summer"
-    elif month in [9, 10, 11]:
-        return "autumn"
-    return "unknown"
-
-def add_time_features(df: pd.DataFrame, key: str = "date") -> pd.DataFrame:
+from src.preprocess.feature_selector import TIME_FEATURE_DTYPE
+
+# Indexed by month number: winter 0, spring 1, summer 2, autumn 3
+SEASON_BY_MONTH = np.array([-1, 0, 0, 1, 1, 1, 2, 2, 2, 3, 3, 3, 0], dtype=np.int8)
+CYCLE_PERIODS = {"hour": 24, "dayofweek": 7, "month": 12}
+
+def calendar_table(timestamps: pd.DatetimeIndex, hour: bool = False, cyclical: bool = False) -> pd.DataFrame:
+    dayofweek = timestamps.dayofweek.to_numpy().astype(TIME_FEATURE_DTYPE)
+    month = timestamps.month.to_numpy().astype(TIME_FEATURE_DTYPE)
+
+    table = pd.DataFrame({
+        "timestamp": timestamps,
+        "dayofweek": dayofweek,
+        "month": month,
+        "day": timestamps.day.to_numpy().astype(TIME_FEATURE_DTYPE),
+        "season": SEASON_BY_MONTH[month],
+        "is_weekend": (dayofweek >= 5).astype(TIME_FEATURE_DTYPE),
+    })
+
+    phases = {"dayofweek": dayofweek, "month": month - 1}
+    if hour:
+        table["hour"] = timestamps.hour.to_numpy().astype(TIME_FEATURE_DTYPE)
+        phases["hour"] = timestamps.hour.to_numpy() + timestamps.minute.to_numpy() / 60
+
+    if cyclical:
+        for name, phase in phases.items():
+            angle = 2 * np.pi * phase / CYCLE_PERIODS[name]
+            table[f"{name}_sin"] = np.sin(angle).astype(np.float32)
+            table[f"{name}_cos"] = np.cos(angle).astype(np.float32)
+
+    return table
+
+def add_time_features(df: pd.DataFrame, key: str = "date", hour: bool = False, cyclical: bool = False) -> pd.DataFrame:
     df[key] = pd.to_datetime(df[key])
 
-    df["dayofweek"] = df[key].dt.dayofweek
-    df["month"] = df[key].dt.month
-    df["day"] = df[key].dt.day
+    # Calendar values are computed once per distinct timestamp and broadcast back through the codes
+    codes, uniques = pd.factorize(df[key])
+    if (codes < 0).any():
+        raise ValueError(f"Column '{key}' contains missing timestamps")
+
+    table = calendar_table(pd.DatetimeIndex(uniques), hour, cyclical)
 
-    df["season"] = df["month"].apply(set_season)
-    df["season"] = df["season"].map({"winter": 0, "spring": 1, "summer": 2, "autumn": 3})
-    df["is_weekend"] = df["dayofweek"].isin([5, 6]).astype(int)
+    for col in table.columns.drop("timestamp"):
+        df[col] = table[col].to_numpy()[codes]
 
     return df
@@ -0,0 +1,211 @@
+import os
+import glob
+import shutil
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from typing import Iterable, Iterator, List, Optional
+
+PARQUET_SUFFIX = ".parquet"
+CSV_SUFFIX = ".csv"
+PART_PREFIX = "part-"
+PART_PATTERN = PART_PREFIX + "*" + PARQUET_SUFFIX
+ROW_GROUP_SIZE = 128 * 1024
+BATCH_ROWS = 1_000_000
+
+
+def frame_path(directory: str, name: str, fmt: str = "parquet") -> str:
+    suffix = PARQUET_SUFFIX if fmt == "parquet" else CSV_SUFFIX
+    return os.path.join(directory, name + suffix)
+
+
+def find_frame(directory: str, name: str) -> Optional[str]:
+    # Parquet wins; CSV is still read so artifacts from older runs keep working
+    for fmt in ("parquet", "csv"):
+        path = frame_path(directory, name, fmt)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def is_parquet(path: str) -> bool:
+    return path.endswith(PARQUET_SUFFIX)
+
+
+def part_path(path: str, index: int) -> str:
+    return os.path.join(path, f"{PART_PREFIX}{index:05d}{PARQUET_SUFFIX}")
+
+
+def part_index(part: str) -> int:
+    return int(os.path.basename(part)[len(PART_PREFIX):-len(PARQUET_SUFFIX)])
+
+
+def list_parts(path: str) -> List[str]:
+    if os.path.isfile(path):
+        return [path]
+    # Numeric order, as the zero padding stops sorting correctly past 99999 parts
+    return sorted(glob.glob(os.path.join(path, PART_PATTERN)), key=part_index)
+
+
+def remove_frame(path: str):
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+def write_frame(df: pd.DataFrame, path: str):
+    remove_frame(path)
+    append_frame(df, path)
+
+
+def append_frame(df: pd.DataFrame, path: str):
+    if not is_parquet(path):
+        df.to_csv(path, mode="a", header=not os.path.exists(path), index=False)
+        return
+
+    # A parquet frame is a directory of parts, so appending never rewrites earlier rows
+    os.makedirs(path, exist_ok=True)
+    part = part_path(path, len(list_parts(path)))
+    tmp_path = part + ".tmp"
+    pq.write_table(arrow_table(df), tmp_path, row_group_size=ROW_GROUP_SIZE)
+    os.replace(tmp_path, part)
+
+
+def write_frame_chunks(chunks: Iterable[pd.DataFrame], path: str):
+    remove_frame(path)
+    if not is_parquet(path):
+        for chunk in chunks:
+            append_frame(chunk, path)
+        return
+
+    # All chunks go into one part through a single writer, so only one chunk is ever in memory
+    os.makedirs(path)
+    part = part_path(path, 0)
+    tmp_path = part + ".tmp"
+    writer = None
+    try:
+        for chunk in chunks:
+            table = arrow_table(chunk)
+            if writer is None:
+                writer = pq.ParquetWriter(tmp_path, table.schema)
+            writer.write_table(table.cast(writer.schema), row_group_size=ROW_GROUP_SIZE)
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is not None:
+        os.replace(tmp_path, part)
+
+
+def arrow_table(df: pd.DataFrame) -> pa.Table:
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    # pandas picks the narrowest code type per frame; parts with more categories must still share one schema
+    fields = [
+        pa.field(field.name, pa.dictionary(pa.int32(), field.type.value_type, field.type.ordered))
+        if pa.types.is_dictionary(field.type) else field
+        for field in table.schema
+    ]
+    return table.cast(pa.schema(fields, metadata=table.schema.metadata))
+
+
+def frame_columns(path: str) -> List[str]:
+    if is_parquet(path):
+        return ds.dataset(list_parts(path), format="parquet").schema.names
+    return list(pd.read_csv(path, nrows=0).columns)
+
+
+def align_timestamp(value, tz) -> pd.Timestamp:
+    value = pd.Timestamp(value)
+    if tz is not None and value.tzinfo is None:
+        return value.tz_localize(tz)
+    if tz is None and value.tzinfo is not None:
+        return value.tz_convert(None)
+    return value
+
+
+def typed_scalar(value, field_type: pa.DataType) -> pa.Scalar:
+    if pa.types.is_timestamp(field_type):
+        value = align_timestamp(value, field_type.tz)
+    return pa.scalar(value, type=field_type)
+
+
+def read_parquet_frame(
+    path: str,
+    columns: Optional[List[str]],
+    start,
+    end,
+    sites: Optional[Iterable],
+    date_col: str,
+    site_col: str
+) -> pd.DataFrame:
+    dataset = ds.dataset(list_parts(path), format="parquet")
+    schema = dataset.schema
+
+    # Filters are pushed into the scan, so row groups outside the range are never decoded
+    condition = None
+    if start is not None:
+        condition = ds.field(date_col) >= typed_scalar(start, schema.field(date_col).type)
+    if end is not None:
+        upper = ds.field(date_col) <= typed_scalar(end, schema.field(date_col).type)
+        condition = upper if condition is None else condition & upper
+    if sites is not None:
+        members = ds.field(site_col).isin(list(sites))
+        condition = members if condition is None else condition & members
+
+    return dataset.to_table(columns=columns, filter=condition).to_pandas()
+
+
+def read_csv_frame(
+    path: str,
+    columns: Optional[List[str]],
+    start,
+    end,
+    sites: Optional[Iterable],
+    date_col: str,
+    site_col: str
+) -> pd.DataFrame:
+    filter_cols = [col for col, used in [(date_col, start is not None or end is not None), (site_col, sites is not None)] if used]
+    usecols = None if columns is None else list(dict.fromkeys([*columns, *filter_cols]))
+
+    df = pd.read_csv(path, usecols=usecols)
+    if date_col in df.columns:
+        df[date_col] = pd.to_datetime(df[date_col], format="ISO8601")
+
+    mask = pd.Series(True, index=df.index)
+    if start is not None:
+        mask &= df[date_col] >= align_timestamp(start, df[date_col].dt.tz)
+    if end is not None:
+        mask &= df[date_col] <= align_timestamp(end, df[date_col].dt.tz)
+    if sites is not None:
+        mask &= df[site_col].isin(list(sites))
+
+    df = df[mask].reset_index(drop=True)
+    return df if columns is None else df[columns]
+
+
+def read_frame(
+    path: str,
+    columns: Optional[List[str]] = None,
+    start=None,
+    end=None,
+    sites: Optional[Iterable] = None,
+    date_col: str = "date",
+    site_col: str = "site_id"
+) -> pd.DataFrame:
+    reader = read_parquet_frame if is_parquet(path) else read_csv_frame
+    return reader(path, columns, start, end, sites, date_col, site_col)
+
+
+def iter_frame(path: str, columns: Optional[List[str]] = None, batch_rows: int = BATCH_ROWS) -> Iterator[pd.DataFrame]:
+    if is_parquet(path):
+        for batch in ds.dataset(list_parts(path), format="parquet").to_batches(columns=columns, batch_size=batch_rows):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, usecols=columns, chunksize=batch_rows)
+
+
+def export_csv(path: str, csv_path: Optional[str] = None) -> str:
+    csv_path = csv_path or os.path.splitext(path)[0] + CSV_SUFFIX
+    read_frame(path).to_csv(csv_path, index=False)
+    return csv_path
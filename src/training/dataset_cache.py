@@ -0,0 +1,163 @@
+import os
+import json
+import time
+import atexit
+import shutil
+import socket
+import hashlib
+import logging
+
+from src.training.dataset_store import MANIFEST_NAME, file_fingerprint, has_prepared_dataset
+from src.training.prepare_dataset import prepare_dataset
+from src.storage.frame_store import find_frame, frame_path
+
+logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+
+CACHE_DIRNAME = "prepared_dataset"
+DEFAULT_MAX_CACHE_BYTES = 20 * 1024 ** 3
+LEASE_PREFIX = ".lease-"
+# Datasets used this recently are never evicted, even without a lease
+RECENT_USE_SECONDS = 30 * 60
+
+
+def dataset_input_paths(dataset_dir, dataset_type):
+    name = f"{dataset_type}_dataset"
+    input_path = find_frame(dataset_dir, name) or frame_path(dataset_dir, name)
+    features_path = os.path.join(dataset_dir, "selected_features.json")
+    return input_path, features_path
+
+
+def dataset_cache_key(input_path, features_path, dataset_type, target_column, sequence_length, layout="windows", train_frac=0.6, val_frac=0.2):
+    with open(features_path, "r") as f:
+        feature_cols = json.load(f)
+
+    config = {
+        "source": file_fingerprint(input_path),
+        "feature_cols": feature_cols,
+        "dataset_type": dataset_type,
+        "target_column": target_column,
+        "sequence_length": sequence_length,
+        "layout": layout,
+        "train_frac": train_frac,
+        "val_frac": val_frac,
+    }
+    payload = json.dumps(config, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()[:16]
+
+
+def prepared_dataset_dir(dataset_dir, dataset_type, target_column, sequence_length, layout="windows", train_frac=0.6, val_frac=0.2):
+    input_path, features_path = dataset_input_paths(dataset_dir, dataset_type)
+    key = dataset_cache_key(input_path, features_path, dataset_type, target_column, sequence_length, layout, train_frac, val_frac)
+    return os.path.join(dataset_dir, CACHE_DIRNAME, key)
+
+
+def directory_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+
+def acquire_lease(prepared_dir):
+    # Held until this process exits, so other processes never evict a dataset it may still have mapped
+    path = os.path.join(prepared_dir, f"{LEASE_PREFIX}{socket.gethostname()}-{os.getpid()}")
+    open(path, "w").close()
+    atexit.register(release_lease, path)
+    return path
+
+
+def release_lease(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def lease_is_live(name):
+    host, _, pid = name[len(LEASE_PREFIX):].rpartition("-")
+    if host != socket.gethostname():
+        # Processes on other hosts cannot be checked, so their leases always count
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except (ProcessLookupError, ValueError):
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def is_in_use(path, last_used):
+    if time.time() - last_used < RECENT_USE_SECONDS:
+        return True
+    return any(name.startswith(LEASE_PREFIX) and lease_is_live(name) for name in os.listdir(path))
+
+
+def evict_prepared_datasets(cache_dir, max_bytes, keep=None):
+    entries = []
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        manifest_path = os.path.join(path, MANIFEST_NAME)
+        if not os.path.isdir(path) or not os.path.exists(manifest_path):
+            continue
+        # The manifest mtime is bumped on every cache hit and serves as the last-used time
+        entries.append((os.path.getmtime(manifest_path), path, directory_size(path)))
+
+    total = sum(size for _, _, size in entries)
+    for last_used, path, size in sorted(entries):
+        if total <= max_bytes:
+            break
+        if keep is not None and os.path.abspath(path) == os.path.abspath(keep):
+            continue
+        if is_in_use(path, last_used):
+            logging.info(f"Keeping prepared dataset {path}, it is in use")
+            continue
+        logging.info(f"Evicting prepared dataset {path} ({size / 1024 ** 2:.1f} MB)")
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+
+
+def ensure_prepared_dataset(
+    dataset_dir,
+    dataset_type,
+    target_column,
+    sequence_length,
+    layout="windows",
+    train_frac=0.6,
+    val_frac=0.2,
+    max_cache_bytes=DEFAULT_MAX_CACHE_BYTES,
+    workers=1,
+    sort_by_site=None,
+):
+    input_path, features_path = dataset_input_paths(dataset_dir, dataset_type)
+    # The sort order is left out of the key: windows are regrouped by site, so it never changes the arrays
+    prepared_dir = prepared_dataset_dir(dataset_dir, dataset_type, target_column, sequence_length, layout, train_frac, val_frac)
+
+    # The lease is taken before the dataset is checked, so no other process can evict it in between
+    os.makedirs(prepared_dir, exist_ok=True)
+    acquire_lease(prepared_dir)
+
+    if has_prepared_dataset(prepared_dir, layout):
+        logging.info(f"Using cached prepared dataset {prepared_dir}")
+        os.utime(os.path.join(prepared_dir, MANIFEST_NAME))
+    else:
+        logging.info(f"Preparing dataset into {prepared_dir}")
+        prepare_dataset(
+            input_path=input_path,
+            features_path=features_path,
+            output_dir=prepared_dir,
+            target_column=target_column,
+            sequence_length=sequence_length,
+            dataset_type=dataset_type,
+            layout=layout,
+            train_frac=train_frac,
+            val_frac=val_frac,
+            workers=workers,
+            sort_by_site=sort_by_site,
+        )
+
+    if max_cache_bytes is not None:
+        evict_prepared_datasets(os.path.dirname(prepared_dir), max_cache_bytes, keep=prepared_dir)
+
+    return prepared_dir
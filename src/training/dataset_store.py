@@ -0,0 +1,106 @@
+import os
+import json
+import hashlib
+import logging
+import numpy as np
+
+logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+
+MANIFEST_NAME = "manifest.json"
+FORMAT_VERSION = 1
+
+_fingerprints = {}
+
+
+def file_fingerprint(path, chunk_size=1 << 20):
+    if os.path.isdir(path):
+        # Parquet datasets are directories of part files
+        digest = hashlib.sha256()
+        for name in sorted(os.listdir(path)):
+            digest.update(name.encode("utf-8"))
+            digest.update(file_fingerprint(os.path.join(path, name), chunk_size).encode("utf-8"))
+        return digest.hexdigest()
+
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if memo_key in _fingerprints:
+        return _fingerprints[memo_key]
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+
+    _fingerprints[memo_key] = digest.hexdigest()
+    return _fingerprints[memo_key]
+
+
+def load_manifest(prepared_dir):
+    manifest_path = os.path.join(prepared_dir, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, "r") as f:
+        return json.load(f)
+
+
+def has_prepared_dataset(prepared_dir, layout="windows"):
+    manifest = load_manifest(prepared_dir)
+    if manifest is None or manifest.get("layout") != layout:
+        return False
+    return all(os.path.exists(os.path.join(prepared_dir, entry["file"])) for entry in manifest["arrays"].values())
+
+
+def clear_manifest(output_dir):
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+
+
+def array_entry(filename, arr):
+    return {"file": filename, "shape": list(arr.shape), "dtype": arr.dtype.str}
+
+
+def save_array(output_dir, name, arr):
+    arr = np.asarray(arr)
+    if np.issubdtype(arr.dtype, np.floating):
+        arr = arr.astype(np.float32, copy=False)
+
+    filename = f"{name}.npy"
+    np.save(os.path.join(output_dir, filename), arr)
+    return array_entry(filename, arr)
+
+
+def write_manifest(output_dir, entries, **metadata):
+    manifest = {"format_version": FORMAT_VERSION, **metadata, "arrays": entries}
+    with open(os.path.join(output_dir, MANIFEST_NAME), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def save_prepared_dataset(output_dir, arrays, **metadata):
+    os.makedirs(output_dir, exist_ok=True)
+
+    # The manifest is written last, so a directory without one is never read as complete
+    clear_manifest(output_dir)
+
+    entries = {}
+    for name, arr in arrays.items():
+        entries[name] = save_array(output_dir, name, arr)
+        logging.info(f"Saved {entries[name]['file']} {tuple(entries[name]['shape'])} to {output_dir}")
+
+    return write_manifest(output_dir, entries, **metadata)
+
+
+def open_prepared_dataset(prepared_dir, mmap_mode="r"):
+    manifest = load_manifest(prepared_dir)
+    if manifest is None:
+        raise FileNotFoundError(f"No prepared dataset manifest found in {prepared_dir}")
+
+    arrays = {}
+    for name, entry in manifest["arrays"].items():
+        arr = np.load(os.path.join(prepared_dir, entry["file"]), mmap_mode=mmap_mode)
+        if list(arr.shape) != entry["shape"] or arr.dtype.str != entry["dtype"]:
+            raise ValueError(f"Array '{name}' in {prepared_dir} does not match its manifest entry")
+        arrays[name] = arr
+
+    return arrays, manifest
@@ -0,0 +1,138 @@
+import os
+import time
+import logging
+import numpy as np
+import tensorflow as tf
+
+from src.training.dataset_store import open_prepared_dataset
+
+logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+
+AUTOTUNE = tf.data.AUTOTUNE
+# Windows loaded per map call while a cache is being filled
+CACHE_LOAD_ROWS = 4096
+# Windows held by the shuffle buffer of a cached dataset, which holds whole windows rather than ids
+CACHE_SHUFFLE_BUFFER = 32768
+
+
+def window_fetcher(arrays, manifest, split):
+    if manifest["layout"] == "windows":
+        X, y = arrays[f"X_{split}"], arrays[f"y_{split}"]
+        return len(y), X.shape[1:], lambda ids: (X[ids], y[ids])
+
+    sequence_length = manifest["sequence_length"]
+    features, targets = arrays["features"], arrays["targets"]
+    starts = np.asarray(arrays[f"{split}_index"])
+    offsets = np.arange(sequence_length)
+
+    def fetch(ids):
+        batch = starts[ids]
+        return features[batch[:, None] + offsets], targets[batch + sequence_length]
+
+    return len(starts), (sequence_length, features.shape[1]), fetch
+
+
+def split_targets(arrays, manifest, split):
+    if manifest["layout"] == "windows":
+        return np.asarray(arrays[f"y_{split}"])
+    return arrays["targets"][np.asarray(arrays[f"{split}_index"]) + manifest["sequence_length"]]
+
+
+def batch_loader(fetch, input_shape):
+    def load(ids):
+        def gather(ids):
+            # Sorted ids read the memory-mapped rows in file order; a batch's contents are unchanged
+            X, y = fetch(np.sort(ids))
+            return X.astype(np.float32, copy=False), y.astype(np.float32, copy=False)
+
+        X, y = tf.numpy_function(gather, [ids], [tf.float32, tf.float32])
+        X.set_shape((None, *input_shape))
+        y.set_shape((None,))
+        return X, y
+
+    return load
+
+
+def make_dataset(fetch, n, input_shape, batch_size=32, shuffle=False, shuffle_buffer=None, cache=None, seed=None):
+    load = batch_loader(fetch, input_shape)
+
+    if cache is None:
+        # Only window ids pass through the shuffle buffer; the parallel map gathers each batch from the memory-mapped arrays
+        dataset = tf.data.Dataset.range(n)
+        if shuffle:
+            dataset = dataset.shuffle(shuffle_buffer or n, seed=seed, reshuffle_each_iteration=True)
+        dataset = dataset.batch(batch_size).map(load, num_parallel_calls=AUTOTUNE, deterministic=not shuffle)
+    else:
+        # A cache can only be read back in storage order, so shuffling draws from a bounded buffer of
+        # whole windows; the full-split shuffle of ids would hold every window in memory
+        dataset = (
+            tf.data.Dataset.range(n)
+            .batch(CACHE_LOAD_ROWS)
+            .map(load, num_parallel_calls=AUTOTUNE)
+            .unbatch()
+            .cache(cache)
+        )
+        if shuffle:
+            dataset = dataset.shuffle(min(shuffle_buffer or CACHE_SHUFFLE_BUFFER, n), seed=seed, reshuffle_each_iteration=True)
+        dataset = dataset.batch(batch_size)
+
+    return dataset.prefetch(AUTOTUNE)
+
+
+def load_input_pipeline(prepared_dir, batch_size=32, shuffle_buffer=None, cache=None, seed=None):
+    arrays, manifest = open_prepared_dataset(prepared_dir)
+
+    def split_dataset(split, shuffle=False, cache=None):
+        n, input_shape, fetch = window_fetcher(arrays, manifest, split)
+        return make_dataset(fetch, n, input_shape, batch_size, shuffle, shuffle_buffer, cache, seed), n, input_shape
+
+    # "memory" keeps the cache in RAM; anything else is a file prefix, with one cache file per prepared
+    # dataset and split, so a prefix reused for another dataset never reads stale windows
+    def split_cache(split):
+        if cache is None:
+            return None
+        return "" if cache == "memory" else f"{cache}.{os.path.basename(os.path.normpath(prepared_dir))}.{split}"
+
+    train, train_samples, input_shape = split_dataset("train", shuffle=True, cache=split_cache("train"))
+    val, _, _ = split_dataset("val", cache=split_cache("val"))
+    test, _, _ = split_dataset("test")
+    return {
+        "train": train,
+        "val": val,
+        "test": test,
+        "y_test": split_targets(arrays, manifest, "test"),
+        "input_shape": input_shape,
+        "train_samples": train_samples,
+    }
+
+
+def steady_throughput(rates):
+    # The first epoch pays for tracing and cache filling, so it is left out when there are others
+    rates = list(rates)[1:] or list(rates)
+    return float(np.median(rates)) if rates else float("nan")
+
+
+class SampleThroughput(tf.keras.callbacks.Callback):
+    def __init__(self, samples_per_epoch):
+        super().__init__()
+        self.samples_per_epoch = samples_per_epoch
+        self.rates = []
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.start = time.perf_counter()
+        self.train_seconds = None
+
+    def on_test_begin(self, logs=None):
+        # Validation runs inside the epoch; only the training steps count
+        if self.train_seconds is None:
+            self.train_seconds = time.perf_counter() - self.start
+
+    def on_epoch_end(self, epoch, logs=None):
+        seconds = self.train_seconds or time.perf_counter() - self.start
+        self.rates.append(self.samples_per_epoch / seconds)
+        if logs is not None:
+            logs["samples_per_second"] = self.rates[-1]
+
+    @property
+    def samples_per_second(self):
+        return steady_throughput(self.rates)
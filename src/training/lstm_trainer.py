@@ -1,26 +1,21 @@
 import os
-import logging
-import numpy as np
 from tensorflow.keras.models import Sequential
 from tensorflow.keras.layers import LSTM, Dense, Dropout
 from tensorflow.keras.callbacks import EarlyStopping
 from tensorflow.keras.optimizers import Adam
 from tensorflow.keras.metrics import MeanAbsoluteError
 
-from src.training.prepare_dataset import prepare_dataset
+from src.training.dataset_cache import DEFAULT_MAX_CACHE_BYTES, ensure_prepared_dataset
+from src.training.dataset_store import open_prepared_dataset
+from src.training.input_pipeline import SampleThroughput, load_input_pipeline
+from src.training.window_dataset import load_window_dataset
 
-def load_file(name, dataset_dir):
-    return np.load(os.path.join(dataset_dir, f"{name}.npy"))
+# The LSTM has always windowed frames sorted by date alone, also for traffic
+SORT_BY_SITE = False
 
 def load_dataset(dataset_dir):
-    return {
-        "X_train": load_file("X_train", dataset_dir),
-        "y_train": load_file("y_train", dataset_dir),
-        "X_val": load_file("X_val", dataset_dir),
-        "y_val": load_file("y_val", dataset_dir),
-        "X_test": load_file("X_test", dataset_dir),
-        "y_test": load_file("y_test", dataset_dir),
-    }
+    arrays, _ = open_prepared_dataset(dataset_dir)
+    return arrays
 
 def build_lstm_model(input_shape, units=64, dropout=0.3, dense_units=32):
     model = Sequential()
@@ -43,32 +38,45 @@ def train_lstm(
     units=64,
     dropout=0.3,
     dense_units=32,
+    lazy_windows=False,
+    max_cache_bytes=DEFAULT_MAX_CACHE_BYTES,
+    prepare_workers=1,
+    input_pipeline=False,
+    shuffle_buffer=None,
+    cache_dataset=None,
+    jit_compile=False,
 ):
-    prepared_dir = os.path.join(dataset_dir, "prepared_dataset")
-
-    required_files = ["X_train.npy", "y_train.npy", "X_val.npy", "y_val.npy", "X_test.npy", "y_test.npy"]
-    missing = [f for f in required_files if not os.path.exists(os.path.join(prepared_dir, f))]
-
-    if missing:
-        logging.info("Preparing dataset...")
-        input_path = os.path.join(dataset_dir, f"{dataset_type}_dataset.csv")
-        feature_path = os.path.join(dataset_dir, "selected_features.json")
-        prepare_dataset(
-            input_path=input_path,
-            features_path=feature_path,
-            output_dir=prepared_dir,
-            target_column=target_column,
-            sequence_length=sequence_length,
-        )
+    layout = "index" if lazy_windows else "windows"
+    prepared_dir = ensure_prepared_dataset(
+        dataset_dir=dataset_dir,
+        dataset_type=dataset_type,
+        target_column=target_column,
+        sequence_length=sequence_length,
+        layout=layout,
+        max_cache_bytes=max_cache_bytes,
+        workers=prepare_workers,
+        sort_by_site=SORT_BY_SITE,
+    )
 
-    data = load_dataset(prepared_dir)
-    input_shape = data["X_train"].shape[1:]
+    if input_pipeline:
+        data = load_input_pipeline(prepared_dir, batch_size=batch_size, shuffle_buffer=shuffle_buffer, cache=cache_dataset)
+        input_shape = data["input_shape"]
+        train_samples = data["train_samples"]
+    elif lazy_windows:
+        data = load_window_dataset(prepared_dir, batch_size=batch_size)
+        input_shape = data["train"].input_shape
+        train_samples = len(data["train"].starts)
+    else:
+        data = load_dataset(prepared_dir)
+        input_shape = data["X_train"].shape[1:]
+        train_samples = len(data["X_train"])
 
     model = build_lstm_model(input_shape, units=units, dropout=dropout, dense_units=dense_units)
     model.compile(
         loss="mse",
         optimizer=Adam(0.001),
-        metrics=[MeanAbsoluteError()]
+        metrics=[MeanAbsoluteError()],
+        jit_compile=jit_compile
     )
 
     early_stop = EarlyStopping(
@@ -76,15 +84,25 @@ def train_lstm(
         patience=10,
         restore_best_weights=True
     )
+    throughput = SampleThroughput(train_samples)
 
-    history = model.fit(
-        data["X_train"], data["y_train"],
-        validation_data=(data["X_val"], data["y_val"]),
-        epochs=epochs,
-        batch_size=batch_size,
-        callbacks=[early_stop],
-        verbose=1
-    )
+    if input_pipeline or lazy_windows:
+        history = model.fit(
+            data["train"],
+            validation_data=data["val"],
+            epochs=epochs,
+            callbacks=[early_stop, throughput],
+            verbose=1
+        )
+    else:
+        history = model.fit(
+            data["X_train"], data["y_train"],
+            validation_data=(data["X_val"], data["y_val"]),
+            epochs=epochs,
+            batch_size=batch_size,
+            callbacks=[early_stop, throughput],
+            verbose=1
+        )
 
     os.makedirs(output_dir, exist_ok=True)
     model_name = f"{dataset_type}_{tag}_lstm.keras"
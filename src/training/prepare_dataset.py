@@ -1,36 +1,100 @@
 import os
 import json
+import shutil
 import logging
+import multiprocessing
 import numpy as np
 import pandas as pd
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+from numpy.lib.format import open_memmap
+from numpy.lib.stride_tricks import sliding_window_view
+
+from src.training.dataset_store import (
+    array_entry, clear_manifest, file_fingerprint, save_array, save_prepared_dataset, write_manifest
+)
+from src.storage.frame_store import frame_columns, is_parquet, read_frame
 
 logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
 
+LAYOUTS = ("windows", "index")
+SHARDS_DIRNAME = "shards"
+# Several shards per worker even out sites with very different lengths
+SHARDS_PER_WORKER = 4
 
-def create_sequences(df, feature_cols, target_col, sequence_length):
-    X, y = [], []
 
+def valid_window_starts(values, target, sequence_length):
+    n_windows = len(values) - sequence_length
+    if n_windows <= 0:
+        return np.empty(0, dtype=np.int64)
+
+    # Prefix sums of NaN rows give the NaN count of every window in O(n)
+    row_has_nan = np.isnan(values).any(axis=1)
+    nan_counts = np.concatenate(([0], np.cumsum(row_has_nan)))
+    window_nans = nan_counts[sequence_length:sequence_length + n_windows] - nan_counts[:n_windows]
+
+    valid = (window_nans == 0) & ~np.isnan(target[sequence_length:])
+    return np.flatnonzero(valid)
+
+
+def build_windows(values, starts, sequence_length):
+    windows = sliding_window_view(values, sequence_length, axis=0)
+    return windows[starts].transpose(0, 2, 1)
+
+
+def iter_group_arrays(df, feature_cols, target_col):
     if "site_id" in df.columns:
-        grouped = df.groupby("site_id")
+        grouped = df.groupby("site_id", observed=True)
     else:
         grouped = [("all", df)]
 
     for _, group in grouped:
         group = group.sort_values("date")
-        for i in range(len(group) - sequence_length):
-            seq_x = group[feature_cols].iloc[i:i + sequence_length].values
-            seq_y = group[target_col].iloc[i + sequence_length]
-            if not np.isnan(seq_x).any() and not np.isnan(seq_y):
-                X.append(seq_x)
-                y.append(seq_y)
+        # Windows are built in float32, the dtype they are stored and trained in
+        values = np.ascontiguousarray(group[feature_cols].to_numpy(dtype=np.float32))
+        target = group[target_col].to_numpy(dtype=np.float32)
+        yield values, target
 
-    return np.array(X), np.array(y)
 
+def create_sequences(df, feature_cols, target_col, sequence_length):
+    X, y = [], []
 
-def manual_split(X, y, train_frac=0.6, val_frac=0.2):
-    n = len(X)
+    for values, target in iter_group_arrays(df, feature_cols, target_col):
+        starts = valid_window_starts(values, target, sequence_length)
+        if len(starts):
+            X.append(build_windows(values, starts, sequence_length))
+            y.append(target[starts + sequence_length])
+
+    if not X:
+        return np.array([], dtype=np.float32), np.array([], dtype=np.float32)
+
+    return np.concatenate(X), np.concatenate(y)
+
+
+def create_window_index(df, feature_cols, target_col, sequence_length):
+    features, targets, starts = [], [], []
+    offset = 0
+
+    for values, target in iter_group_arrays(df, feature_cols, target_col):
+        features.append(values)
+        targets.append(target)
+        starts.append(valid_window_starts(values, target, sequence_length) + offset)
+        offset += len(values)
+
+    if not features:
+        return np.empty((0, len(feature_cols)), dtype=np.float32), np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)
+
+    return np.concatenate(features), np.concatenate(targets), np.concatenate(starts)
+
+
+def split_bounds(n, train_frac=0.6, val_frac=0.2):
     train_end = int(n * train_frac)
     val_end = train_end + int(n * val_frac)
+    return train_end, val_end
+
+
+def manual_split(X, y, train_frac=0.6, val_frac=0.2):
+    train_end, val_end = split_bounds(len(X), train_frac, val_frac)
 
     X_train, y_train = X[:train_end], y[:train_end]
     X_val, y_val = X[train_end:val_end], y[train_end:val_end]
@@ -43,32 +107,192 @@ def manual_split(X, y, train_frac=0.6, val_frac=0.2):
     }
 
 
-def prepare_dataset(input_path, features_path, output_dir, target_column="PM2.5", sequence_length=30, dataset_type=None):
-    df = pd.read_csv(input_path)
+def split_window_index(starts, train_frac=0.6, val_frac=0.2):
+    train_end, val_end = split_bounds(len(starts), train_frac, val_frac)
 
-    if "date" not in df.columns:
+    return {
+        "train_index": starts[:train_end],
+        "val_index": starts[train_end:val_end],
+        "test_index": starts[val_end:],
+    }
+
+
+def resolve_sort_by_site(dataset_type, sort_by_site=None):
+    # Traffic frames are sorted by site before windowing unless the caller says otherwise
+    return dataset_type == "traffic" if sort_by_site is None else sort_by_site
+
+
+def load_prepare_frame(input_path, feature_cols, target_column, sort_by_site=False, sites=None):
+    available = frame_columns(input_path)
+    if "date" not in available:
         raise ValueError("Expected 'date' column not found in dataset.")
 
+    # Only the columns that end up in the windows are read
+    key_cols = ["date"] + (["site_id"] if "site_id" in available else [])
+    wanted = list(dict.fromkeys([*key_cols, *feature_cols, target_column]))
+    df = read_frame(input_path, columns=[col for col in wanted if col in available], sites=sites)
+
     df["date"] = pd.to_datetime(df["date"])
 
     # Сортировка для временной последовательности (по site_id, если есть)
-    if dataset_type == "traffic" and "site_id" in df.columns:
+    if sort_by_site and "site_id" in df.columns:
         df = df.sort_values(by=["site_id", "date"])
     else:
         df = df.sort_values("date")
 
+    if target_column not in df.columns:
+        raise ValueError(f"Target column '{target_column}' not found in dataframe.")
+
+    return df
+
+
+def partition_sites(input_path, n_shards):
+    site_ids = read_frame(input_path, columns=["site_id"])["site_id"]
+    # Sites in the order create_sequences visits them, so the shards concatenate to the unsharded result
+    counts = site_ids.groupby(site_ids, observed=True).size()
+
+    # Contiguous runs of sites, cut where the running row count crosses a multiple of total / n_shards
+    rows_before = (counts.cumsum() - counts).to_numpy()
+    shard_ids = rows_before * n_shards // max(int(counts.sum()), 1)
+    return [counts.index[shard_ids == shard].tolist() for shard in np.unique(shard_ids)]
+
+
+def prepare_shard(shard_dir, sites, input_path, feature_cols, target_column, sequence_length, sort_by_site, layout):
+    df = load_prepare_frame(input_path, feature_cols, target_column, sort_by_site, sites=sites)
+    # Groups are visited in the global site order, whatever order the filtered read returns
+    df["site_id"] = pd.Categorical(df["site_id"], categories=sites)
+
+    if layout == "index":
+        features, targets, starts = create_window_index(df, feature_cols, target_column, sequence_length)
+        arrays = {"features": features, "targets": targets, "starts": starts}
+    else:
+        X, y = create_sequences(df, feature_cols, target_column, sequence_length)
+        if not len(X):
+            X = np.empty((0, sequence_length, len(feature_cols)), dtype=np.float32)
+        arrays = {"X": X, "y": y}
+
+    os.makedirs(shard_dir, exist_ok=True)
+    entries = {name: save_array(shard_dir, name, arr) for name, arr in arrays.items()}
+    return {"dir": shard_dir, "sites": len(sites), "rows": len(df), "arrays": entries}
+
+
+def copy_rows(parts, output_dir, name, start, stop, shifts=None):
+    # Streams rows [start, stop) of the shards' virtual concatenation into one memory-mapped .npy
+    filename = f"{name}.npy"
+    out = open_memmap(os.path.join(output_dir, filename), mode="w+", dtype=parts[0].dtype, shape=(stop - start, *parts[0].shape[1:]))
+
+    offset = 0
+    for i, part in enumerate(parts):
+        begin, end = max(start, offset), min(stop, offset + len(part))
+        if begin < end:
+            rows = part[begin - offset:end - offset]
+            out[begin - start:end - start] = rows + shifts[i] if shifts is not None else rows
+        offset += len(part)
+
+    out.flush()
+    entry = array_entry(filename, out)
+    del out
+    logging.info(f"Saved {filename} {tuple(entry['shape'])} to {output_dir}")
+    return entry
+
+
+def assemble_shards(output_dir, shards, layout, train_frac=0.6, val_frac=0.2):
+    def open_parts(name):
+        return [np.load(os.path.join(shard["dir"], shard["arrays"][name]["file"]), mmap_mode="r") for shard in shards]
+
+    entries = {}
+    if layout == "index":
+        features, targets, starts = open_parts("features"), open_parts("targets"), open_parts("starts")
+        row_offsets = np.concatenate(([0], np.cumsum([len(part) for part in features])[:-1]))
+        entries["features"] = copy_rows(features, output_dir, "features", 0, sum(len(part) for part in features))
+        entries["targets"] = copy_rows(targets, output_dir, "targets", 0, sum(len(part) for part in targets))
+        split_arrays = [(starts, row_offsets, "{split}_index")]
+    else:
+        split_arrays = [(open_parts("X"), None, "X_{split}"), (open_parts("y"), None, "y_{split}")]
+
+    for parts, shifts, pattern in split_arrays:
+        n = sum(len(part) for part in parts)
+        train_end, val_end = split_bounds(n, train_frac, val_frac)
+        for split, (start, stop) in {"train": (0, train_end), "val": (train_end, val_end), "test": (val_end, n)}.items():
+            name = pattern.format(split=split)
+            entries[name] = copy_rows(parts, output_dir, name, start, stop, shifts)
+
+    return entries
+
+
+def prepare_sharded(input_path, feature_cols, output_dir, target_column, sequence_length, sort_by_site, layout, train_frac, val_frac, workers):
+    site_groups = partition_sites(input_path, workers * SHARDS_PER_WORKER)
+    shards_dir = os.path.join(output_dir, SHARDS_DIRNAME)
+    shutil.rmtree(shards_dir, ignore_errors=True)
+    shard_dirs = [os.path.join(shards_dir, f"shard-{i:05d}") for i in range(len(site_groups))]
+
+    logging.info(f"Creating {layout} for {sum(map(len, site_groups))} sites in {len(site_groups)} shards on {workers} workers")
+    worker = partial(
+        prepare_shard,
+        input_path=input_path,
+        feature_cols=feature_cols,
+        target_column=target_column,
+        sequence_length=sequence_length,
+        sort_by_site=sort_by_site,
+        layout=layout,
+    )
+
+    try:
+        # Spawned, not forked: the trainers call this after TensorFlow has started its thread pools
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+            shards = list(executor.map(worker, shard_dirs, site_groups))
+        entries = assemble_shards(output_dir, shards, layout, train_frac, val_frac)
+    finally:
+        shutil.rmtree(shards_dir, ignore_errors=True)
+
+    summary = [{"sites": shard["sites"], "rows": shard["rows"], "windows": shard["arrays"]["starts" if layout == "index" else "y"]["shape"][0]} for shard in shards]
+    return entries, summary
+
+
+def prepare_dataset(input_path, features_path, output_dir, target_column="PM2.5", sequence_length=30, dataset_type=None, layout="windows", train_frac=0.6, val_frac=0.2, workers=1, sort_by_site=None):
     with open(features_path, "r") as f:
         feature_cols = json.load(f)
 
-    if target_column not in df.columns:
-        raise ValueError(f"Target column '{target_column}' not found in dataframe.")
+    if layout not in LAYOUTS:
+        raise ValueError(f"Unknown dataset layout: {layout}")
+    sort_by_site = resolve_sort_by_site(dataset_type, sort_by_site)
+
+    metadata = dict(
+        layout=layout,
+        dataset_type=dataset_type,
+        feature_cols=feature_cols,
+        target_column=target_column,
+        sequence_length=sequence_length,
+        train_frac=train_frac,
+        val_frac=val_frac,
+        source={"path": os.path.abspath(input_path), "fingerprint": file_fingerprint(input_path)},
+    )
 
-    logging.info(f"Creating sequences with target '{target_column}' and length {sequence_length}")
-    X, y = create_sequences(df, feature_cols, target_column, sequence_length)
+    workers = workers or os.cpu_count()
+    # Each worker reads only its sites, which needs the filter pushdown of a Parquet dataset; windows are
+    # built per site whatever the frame's sort order, so every trainer can shard
+    shardable = is_parquet(input_path) and "site_id" in frame_columns(input_path)
+    if workers > 1 and not shardable:
+        logging.info("Sharded preparation needs a Parquet dataset with site_id; preparing in one process")
+    elif workers > 1:
+        os.makedirs(output_dir, exist_ok=True)
+        clear_manifest(output_dir)
+        entries, shards = prepare_sharded(
+            input_path, feature_cols, output_dir, target_column, sequence_length,
+            sort_by_site, layout, train_frac, val_frac, workers
+        )
+        write_manifest(output_dir, entries, shards=shards, **metadata)
+        return
 
-    dataset = manual_split(X, y)
+    df = load_prepare_frame(input_path, feature_cols, target_column, sort_by_site)
+
+    if layout == "index":
+        logging.info(f"Creating window index with target '{target_column}' and length {sequence_length}")
+        features, targets, starts = create_window_index(df, feature_cols, target_column, sequence_length)
+        dataset = {"features": features, "targets": targets, **split_window_index(starts, train_frac, val_frac)}
+    else:
+        logging.info(f"Creating sequences with target '{target_column}' and length {sequence_length}")
+        X, y = create_sequences(df, feature_cols, target_column, sequence_length)
+        dataset = manual_split(X, y, train_frac, val_frac)
 
-    os.makedirs(output_dir, exist_ok=True)
-    for split_name, arr in dataset.items():
-        np.save(os.path.join(output_dir, f"{split_name}.npy"), arr)
-        logging.info(f"Saved {split_name}.npy to {output_dir}")
+    save_prepared_dataset(output_dir, dataset, **metadata)
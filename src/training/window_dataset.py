@@ -0,0 +1,59 @@
+import math
+import numpy as np
+from tensorflow.keras.utils import Sequence
+
+from src.training.dataset_store import open_prepared_dataset
+
+
+class WindowSequence(Sequence):
+    def __init__(self, features, targets, starts, sequence_length, batch_size=32, shuffle=False):
+        super().__init__()
+        self.features = features
+        self.targets = targets
+        self.starts = starts
+        self.sequence_length = sequence_length
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.offsets = np.arange(sequence_length)
+        self.order = np.arange(len(starts))
+        if shuffle:
+            np.random.shuffle(self.order)
+
+    @property
+    def input_shape(self):
+        return (self.sequence_length, self.features.shape[1])
+
+    def __len__(self):
+        return math.ceil(len(self.starts) / self.batch_size)
+
+    def __getitem__(self, idx):
+        batch = self.starts[self.order[idx * self.batch_size:(idx + 1) * self.batch_size]]
+        X = self.features[batch[:, None] + self.offsets]
+        y = self.targets[batch + self.sequence_length]
+        return X, y
+
+    def on_epoch_end(self):
+        if self.shuffle:
+            np.random.shuffle(self.order)
+
+
+def load_window_dataset(prepared_dir, batch_size=32):
+    arrays, manifest = open_prepared_dataset(prepared_dir)
+    if manifest["layout"] != "index":
+        raise ValueError(f"Prepared dataset in {prepared_dir} is not a window index")
+
+    sequence_length = manifest["sequence_length"]
+    features = arrays["features"]
+    targets = arrays["targets"]
+
+    def make_sequence(split, shuffle=False):
+        starts = np.asarray(arrays[f"{split}_index"])
+        return WindowSequence(features, targets, starts, sequence_length, batch_size=batch_size, shuffle=shuffle)
+
+    test = make_sequence("test")
+    return {
+        "train": make_sequence("train", shuffle=True),
+        "val": make_sequence("val"),
+        "test": test,
+        "y_test": targets[test.starts + sequence_length],
+    }
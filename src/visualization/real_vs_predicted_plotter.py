@@ -1,26 +1,29 @@
 import os
-import json
 import logging
-import numpy as np
 import matplotlib.pyplot as plt
 from tensorflow.keras.models import load_model
 
-logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+from src.preprocess.scaler import FeatureScaler
+from src.training.dataset_store import open_prepared_dataset
+from src.training.window_dataset import load_window_dataset
 
-def plot_real_vs_predicted(dataset_dir, model_path, scaler_path, model_name: str, model_type: str, target_col: str, output_dir: str):
-    X_test = np.load(os.path.join(dataset_dir, "prepared_dataset", "X_test.npy"))
-    y_test = np.load(os.path.join(dataset_dir, "prepared_dataset", "y_test.npy"))
+logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
 
+def plot_real_vs_predicted(prepared_dir, model_path, scaler_path, model_name: str, model_type: str, target_col: str, output_dir: str):
     model = load_model(model_path)
-    y_pred = model.predict(X_test).flatten()
 
-    with open(scaler_path, "r") as f:
-        scaler = json.load(f)
-    mean = scaler[target_col]["mean"]
-    std = scaler[target_col]["std"]
+    arrays, manifest = open_prepared_dataset(prepared_dir)
+    if manifest["layout"] == "windows":
+        y_test = arrays["y_test"]
+        y_pred = model.predict(arrays["X_test"]).flatten()
+    else:
+        data = load_window_dataset(prepared_dir)
+        y_test = data["y_test"]
+        y_pred = model.predict(data["test"]).flatten()
 
-    y_test_denorm = y_test * std + mean
-    y_pred_denorm = y_pred * std + mean
+    scaler = FeatureScaler.load(scaler_path)
+    y_test_denorm = scaler.inverse_transform(y_test, target_col)
+    y_pred_denorm = scaler.inverse_transform(y_pred, target_col)
 
     plt.figure(figsize=(10, 5))
     plt.plot(y_test_denorm[:200], label="Real", linewidth=2)